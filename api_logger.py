@@ -1,171 +1,335 @@
+import os
+import gzip
 import json
+import time
+import queue
+import atexit
+import shutil
 import datetime
+import threading
 import traceback
 from pathlib import Path
 
-# Import all prompt templates to replace them in logs
 try:
-    from structured_output import (
-        REPHRASE_SYSTEM_PROMPT,
-        CHOOSE_PARSER_SYSTEM_PROMPT,
-        QUANTIFIED_SYSTEM_PROMPT,
-        BINARY_LOGICAL_SYSTEM_PROMPT,
-        UNARY_LOGICAL_SYSTEM_PROMPT,
-        CHOOSE_RELATION_SYSTEM_PROMPT,
-        ADJECTIVE_SYSTEM_PROMPT,
-        INTRANSITIVE_SYSTEM_PROMPT,
-        TRANSITIVE_SYSTEM_PROMPT,
-        DITRANSITIVE_SYSTEM_PROMPT
-    )
-    PROMPT_TEMPLATES = {
-        'REPHRASE_SYSTEM_PROMPT': REPHRASE_SYSTEM_PROMPT,
-        'CHOOSE_PARSER_SYSTEM_PROMPT': CHOOSE_PARSER_SYSTEM_PROMPT,
-        'QUANTIFIED_SYSTEM_PROMPT': QUANTIFIED_SYSTEM_PROMPT,
-        'BINARY_LOGICAL_SYSTEM_PROMPT': BINARY_LOGICAL_SYSTEM_PROMPT,
-        'UNARY_LOGICAL_SYSTEM_PROMPT': UNARY_LOGICAL_SYSTEM_PROMPT,
-        'CHOOSE_RELATION_SYSTEM_PROMPT': CHOOSE_RELATION_SYSTEM_PROMPT,
-        'ADJECTIVE_SYSTEM_PROMPT': ADJECTIVE_SYSTEM_PROMPT,
-        'INTRANSITIVE_SYSTEM_PROMPT': INTRANSITIVE_SYSTEM_PROMPT,
-        'TRANSITIVE_SYSTEM_PROMPT': TRANSITIVE_SYSTEM_PROMPT,
-        'DITRANSITIVE_SYSTEM_PROMPT': DITRANSITIVE_SYSTEM_PROMPT
-    }
+    from structured_output import PROMPT_TEMPLATES
 except ImportError:
     PROMPT_TEMPLATES = {}
 
-class APILogger:
-    """Interceptor for logging API calls between pipeline and LLM wrappers"""
-    
-    def __init__(self, log_file=None, console_output=True):
-        # Generate timestamped filename if not provided
-        if log_file is None:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            # Create .log directory if it doesn't exist
-            log_dir = Path(".log")
-            log_dir.mkdir(parents=True, exist_ok=True)
-            log_file = log_dir / f"api_calls_{timestamp}.log"
-        
-        self.log_file = log_file
+_STOP = object()
+
+
+class _LogWriter:
+    """Queue, background thread and file of one log path, shared by the APILoggers writing to it"""
+
+    def __init__(self, log_file, console_output, max_bytes, compress, queue_size, batch_size):
+        self.log_file = Path(log_file)
+        self.log_file.parent.mkdir(parents=True, exist_ok=True)
         self.console_output = console_output
+        self.max_bytes = max_bytes  # rotate once the current file is larger, None = never
+        self.compress = compress  # gzip rotated files
+        self.batch_size = batch_size  # max entries written per file write/flush
         self.call_count = 0
+        self.dropped = 0
+        self.rotations = 0
         self.start_time = datetime.datetime.now()
-        
-        # Create log file with header
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            f.write(f"=== API Call Log Started at {self.start_time} ===\n\n")
-    
-    def _replace_prompts_with_names(self, text):
-        """Replace full prompt template text with just [PROMPT_NAME]"""
-        result = text
-        for prompt_name, prompt_text in PROMPT_TEMPLATES.items():
-            if prompt_text in result:
-                result = result.replace(prompt_text, f"[{prompt_name}]")
-        return result
-    
-    def log_call(self, wrapper_name, method_name, text, fmt, step_info=""):
-        """Log API call before execution"""
-        self.call_count += 1
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        
-        # Replace prompt templates with their names
-        clean_text = self._replace_prompts_with_names(text)
-        
-        log_entry = f"""
-{'='*80}
-[CALL #{self.call_count}] {timestamp}
-Wrapper: {wrapper_name}
-Method: {method_name}
-{f'Step: {step_info}' if step_info else ''}
----
-INPUT TEXT:
-{clean_text}
----
-FORMAT/SCHEMA:
-{self._format_schema(fmt)}
-{'='*80}
-"""
-        self._write_log(log_entry)
-        return self.call_count
-    
-    def log_response(self, call_id, response, elapsed_time=None):
-        """Log successful API response"""
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        
-        log_entry = f"""
-[RESPONSE #{call_id}] {timestamp}
-{f'Elapsed: {elapsed_time:.3f}s' if elapsed_time else ''}
----
-RESPONSE:
-{self._format_response(response)}
----
-SUCCESS ✓
-"""
-        self._write_log(log_entry)
-    
-    def log_error(self, call_id, error, elapsed_time=None):
-        """Log API error"""
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        
-        log_entry = f"""
-[ERROR #{call_id}] {timestamp}
-{f'Elapsed: {elapsed_time:.3f}s' if elapsed_time else ''}
----
-ERROR TYPE: {type(error).__name__}
-ERROR MESSAGE:
-{str(error)}
----
-TRACEBACK:
-{traceback.format_exc()}
----
-FAILED ✗
-"""
-        self._write_log(log_entry)
-    
-    def _format_schema(self, fmt):
-        """Format schema for logging"""
+
+        self._count_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._schemas = {}  # response type -> (name, schema dict)
+        self._written_schemas = set()
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="api-logger", daemon=True)
+        self._thread.start()
+        self.refs = 0  # open APILogger handles
+        atexit.register(self.close)
+
+        self._put({"event": "start", "ts": self.start_time.isoformat()})
+
+    def _put(self, entry):
         try:
-            if hasattr(fmt, 'model_json_schema'):
-                schema = fmt.model_json_schema()
-                return json.dumps(schema, indent=2)
-            elif hasattr(fmt, '__name__'):
-                return fmt.__name__
-            else:
-                return str(fmt)
-        except Exception as e:
-            return f"<Unable to format schema: {e}>"
-    
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._count_lock:
+                self.dropped += 1
+
+    def _schema(self, fmt):
+        """(name, JSON schema) of a response type, computed once per type"""
+        schema = self._schemas.get(fmt)
+        if schema is None:
+            try:
+                schema = (fmt.__name__, fmt.model_json_schema())
+            except Exception:
+                schema = (getattr(fmt, "__name__", str(fmt)), None)
+            self._schemas[fmt] = schema
+        return schema
+
+    def next_call_id(self):
+        with self._count_lock:
+            self.call_count += 1
+            return self.call_count
+
+    def _serialize(self, entry):
+        """Entry as JSON lines, preceded by its schema the first time a type is seen"""
+        lines = []
+        if entry["event"] == "call":
+            name, schema = self._schema(entry["schema"])
+            if name not in self._written_schemas:
+                self._written_schemas.add(name)
+                lines.append(json.dumps({"event": "schema", "name": name, "schema": schema}, separators=(",", ":")))
+            entry["schema"] = name
+        elif entry["event"] == "response":
+            entry["response"] = self._format_response(entry["response"])
+        elif entry["event"] == "error":
+            error = entry.pop("error")
+            entry["error_type"] = type(error).__name__
+            entry["message"] = str(error)
+            entry["traceback"] = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        lines.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str))
+        return lines
+
     def _format_response(self, response):
         """Format response for logging"""
         try:
             if hasattr(response, 'model_dump'):
-                return json.dumps(response.model_dump(), indent=2)
+                return response.model_dump(mode="json")
             elif hasattr(response, 'dict'):
-                return json.dumps(response.dict(), indent=2)
+                return response.dict()
             else:
                 return str(response)
         except Exception as e:
             return f"<Unable to format response: {e}>"
-    
-    def _write_log(self, entry):
-        """Write log entry to file and optionally console"""
-        if self.console_output:
-            print(entry)
-        
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(entry + "\n")
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        self.rotations += 1
+        suffix = "".join(self.log_file.suffixes)
+        stem = self.log_file.name[: len(self.log_file.name) - len(suffix)] if suffix else self.log_file.name
+        rotated = self.log_file.with_name(f"{stem}.{self.rotations}{suffix}")
+        os.replace(self.log_file, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._written_schemas.clear()
+
+    def _write_batch(self, entries):
+        """Write log entries to file and optionally console"""
+        if self._file is None:
+            self._file = open(self.log_file, "a", encoding="utf-8")
+        for entry in entries:
+            for line in self._serialize(entry):
+                self._file.write(line + "\n")
+                if self.console_output:
+                    print(line)
+        self._file.flush()
+        if self.max_bytes is not None and os.fstat(self._file.fileno()).st_size >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        while True:
+            # Everything queued while the previous batch was written goes out together
+            entries = [self._queue.get()]
+            while len(entries) < self.batch_size:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(e is _STOP for e in entries)
+            try:
+                self._write_batch([e for e in entries if e is not _STOP])
+            except Exception as e:
+                print(f"APILogger failed to write {len(entries)} entries: {e}")
+            for _ in entries:
+                self._queue.task_done()
+            if stop:
+                break
+
+    def flush(self):
+        """Block until every queued entry is written"""
+        self._queue.join()
+
+    def close(self):
+        atexit.unregister(self.close)
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# One writer per log path, so loggers created together share a file, its
+# call ids and a single thread instead of each starting their own
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class APILogger:
+    """Interceptor backend that logs API calls as compact JSONL from a background thread.
+
+    The calling thread only builds a small dict and puts it on a bounded queue;
+    serialization, batching, rotation and compression happen in the writer
+    thread. When the queue is full the entry is dropped and counted in
+    `dropped` rather than blocking the LLM call.
+
+    Loggers opened on the same path share one writer (the first one's
+    settings apply); it stops when the last of them is closed, or at exit.
+
+    Each file holds "schema" entries (once per response type), then "call",
+    "response" and "error" entries joined by their call id.
+    """
+
+    def __init__(self, log_file=None, console_output=True, max_bytes=50 * 2 ** 20, compress=False,
+                 queue_size=10_000, batch_size=256):
+        # Generate timestamped filename if not provided
+        if log_file is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Create .log directory if it doesn't exist
+            log_dir = Path(".log")
+            log_dir.mkdir(parents=True, exist_ok=True)
+            log_file = log_dir / f"api_calls_{timestamp}.jsonl"
+
+        self._key = str(Path(log_file).resolve())
+        with _writers_lock:
+            writer = _writers.get(self._key)
+            if writer is None or not writer._thread.is_alive():
+                writer = _LogWriter(log_file, console_output, max_bytes, compress, queue_size, batch_size)
+                _writers[self._key] = writer
+            writer.refs += 1
+        self._writer = writer
+        self._closed = False
+        self.log_file = writer.log_file
+        self.console_output = writer.console_output
+
+    @property
+    def call_count(self):
+        return self._writer.call_count
+
+    @property
+    def dropped(self):
+        return self._writer.dropped
+
+    @property
+    def rotations(self):
+        return self._writer.rotations
+
+    @property
+    def start_time(self):
+        return self._writer.start_time
+
+    def log_call(self, wrapper_name, method_name, text, fmt, step_info=""):
+        """Log API call before execution"""
+        call_id = self._writer.next_call_id()
+
+        # Known templates are logged by name; only the variable suffix is kept
+        template = getattr(text, "template_name", "")
+        entry = {
+            "event": "call",
+            "id": call_id,
+            "ts": time.time(),
+            "wrapper": wrapper_name,
+            "method": method_name,
+            "template": template,
+            "input": text.suffix if template in PROMPT_TEMPLATES else str(text),
+            "sentence": getattr(text, "sentence", None),
+            "schema": fmt,
+        }
+        if step_info:
+            entry["step"] = step_info
+        self._writer._put(entry)
+        return call_id
+
+    def log_response(self, call_id, response, elapsed_time=None):
+        """Log successful API response"""
+        self._writer._put({"event": "response", "id": call_id, "ts": time.time(), "elapsed": elapsed_time, "response": response})
+
+    def log_error(self, call_id, error, elapsed_time=None):
+        """Log API error"""
+        self._writer._put({"event": "error", "id": call_id, "ts": time.time(), "elapsed": elapsed_time, "error": error})
+
+    def flush(self):
+        """Block until every queued entry is written"""
+        self._writer.flush()
+
+    def close(self):
+        """Release this logger; the shared writer stops with the last one"""
+        if self._closed:
+            return
+        self._closed = True
+        with _writers_lock:
+            self._writer.refs -= 1
+            last = self._writer.refs <= 0
+            if last and _writers.get(self._key) is self._writer:
+                del _writers[self._key]
+        if last:
+            self._writer.close()
+
+
+def _log_order(path):
+    # api_calls_<ts>.<n>.jsonl[.gz] are rotated parts of api_calls_<ts>.jsonl, oldest first
+    parts = path.name.split(".")
+    rotation = int(parts[1]) if len(parts) > 2 and parts[1].isdigit() else float("inf")
+    return (str(path.parent), parts[0], rotation)
+
+
+def read_log(paths):
+    """Yield (call, outcome) entry pairs from APILogger JSONL files or directories.
+
+    `outcome` is the matching "response" or "error" entry, or None if the call
+    never finished. Rotated and gzip-compressed parts are read in order, so a
+    call and its response may sit in different parts.
+    """
+    files = []
+    for path in [paths] if isinstance(paths, (str, Path)) else paths:
+        path = Path(path)
+        if path.is_dir():
+            files += list(path.glob("api_calls_*.jsonl")) + list(path.glob("api_calls_*.jsonl.gz"))
+        else:
+            files.append(path)
+
+    calls = {}
+    for file in sorted(files, key=_log_order):
+        opener = gzip.open if file.suffix == ".gz" else open
+        with opener(file, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                event = entry.get("event")
+                if event == "start":
+                    # A new logger run; call ids start over
+                    for call in calls.values():
+                        yield call, None
+                    calls = {}
+                elif event == "call":
+                    calls[entry["id"]] = entry
+                elif event in ("response", "error") and entry.get("id") in calls:
+                    yield calls.pop(entry["id"]), entry
+    for call in calls.values():
+        yield call, None
+
+
+def prompt_text(call):
+    """Full prompt of a logged call, re-expanding the template name"""
+    template = call.get("template", "")
+    if template in PROMPT_TEMPLATES:
+        return PROMPT_TEMPLATES[template] + call["input"]
+    return call["input"]
 
 
 class LLMInterceptor:
     """Generic wrapper that intercepts any LLM wrapper calls with logging"""
-    
+
     def __init__(self, llm_wrapper, logger, wrapper_name="LLMWrapper"):
         self.wrapper = llm_wrapper
         self.logger = logger
         self.wrapper_name = wrapper_name
-    
+
     def generate(self, text, fmt):
         """Intercept generate call with logging"""
-        import time
-        
         # Log the call
         call_id = self.logger.log_call(
             wrapper_name=self.wrapper_name,
@@ -173,29 +337,49 @@ class LLMInterceptor:
             text=text,
             fmt=fmt
         )
-        
+
         start_time = time.time()
-        
+
         try:
             # Make the actual API call
             response = self.wrapper.generate(text, fmt)
-            
+
             elapsed = time.time() - start_time
-            
+
             # Log successful response
             self.logger.log_response(call_id, response, elapsed)
-            
+
             return response
-            
+
         except Exception as e:
             elapsed = time.time() - start_time
-            
+
             # Log the error
             self.logger.log_error(call_id, e, elapsed)
-            
+
             # Re-raise the exception
             raise
 
+    async def agenerate(self, text, fmt):
+        """Intercept async generate call with logging"""
+        call_id = self.logger.log_call(
+            wrapper_name=self.wrapper_name,
+            method_name="agenerate",
+            text=text,
+            fmt=fmt
+        )
+
+        start_time = time.time()
+
+        try:
+            response = await self.wrapper.agenerate(text, fmt)
+            self.logger.log_response(call_id, response, time.time() - start_time)
+            return response
+
+        except Exception as e:
+            self.logger.log_error(call_id, e, time.time() - start_time)
+            raise
+
 
 # Alias for backwards compatibility
 GeminiInterceptor = LLMInterceptor
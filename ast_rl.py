@@ -1,3 +1,4 @@
+import hashlib
 from typing import List, Union, Literal
 from pydantic import BaseModel, Field, PrivateAttr
 
@@ -54,7 +55,7 @@ class RelationAdjective(BaseModel):
         return {
             "node_type": "RelationAdjective",
             "adjective": self.adjective,
-            "obj": self.obj
+            "obj": self.obj.to_dict()
         }
 
     def getChild(self):
@@ -79,7 +80,7 @@ class RelationIntransitiveVerb(BaseModel):
         return {
             "node_type": "RelationIntransitiveVerb",
             "verb": self.verb,
-            "subject": self.subject
+            "subject": self.subject.to_dict()
         }
 
     def getChild(self):
@@ -105,8 +106,8 @@ class RelationTransitiveVerb(BaseModel):
         return {
             "node_type": "RelationTransitiveVerb",
             "verb": self.verb,
-            "subject": self.subject,
-            "obj" : self.obj
+            "subject": self.subject.to_dict(),
+            "obj" : self.obj.to_dict()
         }
 
     def getChild(self):
@@ -134,9 +135,9 @@ class RelationDitransitiveVerb(BaseModel):
         return {
             "node_type": "RelationDitransitiveVerb",
             "verb": self.verb,
-            "subject": self.subject,
-            "direct_obj" : self.direct_obj,
-            "indirect_obj" : self.indirect_obj
+            "subject": self.subject.to_dict(),
+            "direct_obj" : self.direct_obj.to_dict(),
+            "indirect_obj" : self.indirect_obj.to_dict()
         }
 
     def getChild(self):
@@ -152,7 +153,34 @@ class RelationDitransitiveVerb(BaseModel):
     def z3expression_pass(self):
         return f"{self.verb}({self.subject.z3expression_pass()},{self.indirect_obj.z3expression_pass()},{self.direct_obj.z3expression_pass()})"
 
-RelationalSentence = Union[RelationIntransitiveVerb, RelationAdjective, RelationTransitiveVerb, RelationDitransitiveVerb]
+class RelationOpaque(BaseModel):
+    """Unparsed clause kept as one atomic proposition, e.g. when a parse budget ran out"""
+    clause : str
+    reason : str = ""
+
+    def __str__(self):
+        return f"⟦{self.clause}⟧"
+
+    def to_dict(self):
+        return {
+            "node_type": "RelationOpaque",
+            "clause": self.clause,
+            "reason": self.reason
+        }
+
+    def getChild(self):
+        return []
+
+    def _z3name(self):
+        return "Opaque_" + hashlib.sha1(self.clause.encode("utf-8")).hexdigest()[:10]
+
+    def z3declaration_pass(self):
+        return f"{self._z3name()} = Bool('{self._z3name()}')\n"
+
+    def z3expression_pass(self):
+        return self._z3name()
+
+RelationalSentence = Union[RelationIntransitiveVerb, RelationAdjective, RelationTransitiveVerb, RelationDitransitiveVerb, RelationOpaque]
 
 class BinaryOperator(BaseModel):
     left : "Sentence"
@@ -317,4 +345,35 @@ class RelationalLogic(BaseModel):
         z3_code += "print(f'Checking satisfiability...')\n"
         z3_code += "result = s.check()\n"
         z3_code += "print(f'Result: {result}')\n"
-        return z3_code
\ No newline at end of file
+        return z3_code
+
+
+NODE_TYPES = {
+    m.__name__: m for m in (
+        Constant, Variable,
+        RelationAdjective, RelationIntransitiveVerb, RelationTransitiveVerb, RelationDitransitiveVerb, RelationOpaque,
+        BinaryOperator, UnaryOperator, QuantifiedSentence, RelationalLogic
+    )
+}
+
+def is_degraded(node):
+    """True if any part of the tree was collapsed into a RelationOpaque"""
+    if isinstance(node, RelationOpaque):
+        return True
+    return any(is_degraded(c) for c in node.getChild())
+
+def from_dict(data):
+    """Rebuild a node from the output of its to_dict()"""
+    node_type = data["node_type"]
+    if node_type not in NODE_TYPES:
+        raise ValueError(f"Unknown node type: {node_type}")
+    fields = {}
+    for key, value in data.items():
+        if key in ("node_type", "text"):
+            continue
+        if isinstance(value, dict) and "node_type" in value:
+            value = from_dict(value)
+        elif isinstance(value, list):
+            value = [from_dict(v) if isinstance(v, dict) else v for v in value]
+        fields[key] = value
+    return NODE_TYPES[node_type](**fields)
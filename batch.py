@@ -0,0 +1,400 @@
+import re
+import json
+import time
+import hashlib
+import datetime
+from pathlib import Path
+from pydantic import BaseModel
+import structured_output
+from structured_output import *
+from ast_rl import *
+from budget import BudgetExceeded
+from pipeline import (
+    RELATION_PARSERS, _chat_messages, _rephrase_prompt, _input_prompt, _classify_prompt, _relation_node,
+    _quantified_is_atomic, _binary_is_atomic, _unary_is_atomic
+)
+
+# Response types by name, so a batch line can be validated from its schema name
+SCHEMAS = {
+    name: obj for name, obj in vars(structured_output).items()
+    if isinstance(obj, type) and issubclass(obj, BaseModel) and obj is not BaseModel
+}
+
+
+class _Job:
+    """One pending node of a parse tree, advanced one LLM call per level"""
+
+    def __init__(self, stage, text, answer=None, depth=1):
+        self.stage = stage      # rephrase, classify, quantified, binary, unary, choose_relation, relation
+        self.text = text
+        self.depth = depth      # tree depth of the node, 1 for the root as in Pipeline.parse
+        self.answer = answer    # ChooseRelation answer for the relation stage
+        self.kind = None        # quantified, binary, unary or leaf once expanded
+        self.data = None        # quantifier/variable or operator of an inner node
+        self.node = None        # finished relation node of a leaf
+        self.children = []
+
+    def prompt(self):
+        if self.stage == 'rephrase':
+            return _rephrase_prompt(self.text), Rephrased
+        elif self.stage == 'classify':
+            return _classify_prompt(self.text), ChooseParser
+        elif self.stage == 'quantified':
+            return _input_prompt(QUANTIFIED_SYSTEM_PROMPT, self.text), QuantifiedParser
+        elif self.stage == 'binary':
+            return _input_prompt(BINARY_LOGICAL_SYSTEM_PROMPT, self.text), BinaryLogicalParser
+        elif self.stage == 'unary':
+            return _input_prompt(UNARY_LOGICAL_SYSTEM_PROMPT, self.text), UnaryLogicalParser
+        elif self.stage == 'choose_relation':
+            return _input_prompt(CHOOSE_RELATION_SYSTEM_PROMPT, self.text), ChooseRelation
+        else:
+            system_prompt, fmt = RELATION_PARSERS[self.answer]
+            return _input_prompt(system_prompt, self.text), fmt
+
+    def advance(self, r):
+        """Apply the response of this level and return the jobs pending for the next level"""
+        if self.stage == 'rephrase':
+            self.text, self.stage = r.rephrased, 'classify'
+            return [self]
+        elif self.stage == 'classify':
+            stages = {'A': 'choose_relation', 'B': 'quantified', 'C': 'binary', 'D': 'unary'}
+            if r.answer not in stages:
+                raise ValueError("Invalid parser option")
+            self.stage = stages[r.answer]
+            return [self]
+        elif self.stage == 'quantified':
+            if _quantified_is_atomic(self.text, r):
+                self.stage = 'choose_relation'
+                return [self]
+            self.kind, self.data = 'quantified', (r.quantifier, r.variable if r.variable != "" else "x")
+            self.children = [_Job('classify', r.sentence_without_quantifier, depth=self.depth + 1)]
+        elif self.stage == 'binary':
+            if _binary_is_atomic(self.text, r):
+                self.stage = 'choose_relation'
+                return [self]
+            self.kind, self.data = 'binary', r.operator
+            self.children = [_Job('classify', r.left_operand, depth=self.depth + 1),
+                             _Job('classify', r.right_operand, depth=self.depth + 1)]
+        elif self.stage == 'unary':
+            if _unary_is_atomic(self.text, r):
+                self.stage = 'choose_relation'
+                return [self]
+            self.kind, self.data = 'unary', r.operator
+            self.children = [_Job('classify', r.operand, depth=self.depth + 1)]
+        elif self.stage == 'choose_relation':
+            if r.answer not in RELATION_PARSERS:
+                raise ValueError("Invalid relation option")
+            self.stage, self.answer = 'relation', r.answer
+            return [self]
+        else:
+            self.kind = 'leaf'
+            self.node, _ = _relation_node(self.answer, r)
+        self.stage = 'done'
+        return list(self.children)
+
+    def collapse(self, reason):
+        """Keep this node's text as an opaque clause instead of parsing it further"""
+        self.kind, self.stage = 'leaf', 'done'
+        self.node = RelationOpaque(clause=self.text, reason=reason)
+
+    def build(self):
+        if self.kind == 'leaf':
+            return self.node
+        elif self.kind == 'quantified':
+            return QuantifiedSentence(quantifier=self.data[0], variable=Variable(name=self.data[1]), sentence=self.children[0].build())
+        elif self.kind == 'binary':
+            return BinaryOperator(operator=self.data, left=self.children[0].build(), right=self.children[1].build())
+        else:
+            return UnaryOperator(operator=self.data, sentence=self.children[0].build())
+
+
+def _request_id(prompt, fmt):
+    return hashlib.sha256((fmt.__name__ + "\x00" + prompt).encode("utf-8")).hexdigest()[:32]
+
+
+def _strict_schema(fmt):
+    try:
+        from openai.lib._pydantic import to_strict_json_schema
+        return to_strict_json_schema(fmt)
+    except ImportError:
+        return fmt.model_json_schema()
+
+
+def write_requests(path, requests, model, provider):
+    """Write {custom_id: (prompt, fmt)} as an OpenAI or Gemini batch JSONL file"""
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, (prompt, fmt) in requests.items():
+            if provider == 'openai':
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": model,
+                        "messages": _chat_messages(prompt),
+                        "temperature": 0,
+                        "response_format": {
+                            "type": "json_schema",
+                            "json_schema": {"name": fmt.__name__, "schema": _strict_schema(fmt), "strict": True}
+                        }
+                    }
+                }
+            elif provider == 'gemini':
+                request = {
+                    "contents": [{"role": "user", "parts": [{"text": getattr(prompt, "suffix", prompt)}]}],
+                    "generation_config": {
+                        "temperature": 0,
+                        "response_mime_type": "application/json",
+                        "response_json_schema": fmt.model_json_schema()
+                    }
+                }
+                if isinstance(prompt, Prompt):
+                    request["system_instruction"] = {"parts": [{"text": prompt.template}]}
+                line = {"key": custom_id, "request": request}
+            else:
+                raise ValueError("Batch provider is not valid")
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def read_results(path, provider):
+    """Read a batch results JSONL file into {custom_id: response text or Exception}"""
+    results = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            try:
+                if provider == 'openai':
+                    custom_id = entry["custom_id"]
+                    if entry.get("error"):
+                        raise RuntimeError(str(entry["error"]))
+                    body = entry["response"]["body"]
+                    results[custom_id] = body["choices"][0]["message"]["content"]
+                else:
+                    custom_id = entry["key"]
+                    if entry.get("error"):
+                        raise RuntimeError(str(entry["error"]))
+                    parts = entry["response"]["candidates"][0]["content"]["parts"]
+                    results[custom_id] = "".join(p.get("text", "") for p in parts)
+            except (KeyError, IndexError, RuntimeError) as e:
+                results[entry.get("custom_id", entry.get("key"))] = e
+    return results
+
+
+# Sentence embedded in the variable part of the pipeline prompts
+_SENTENCE_PATTERN = re.compile(r"(?:Input: \"(.*)\"|Sentence: '(.*)')\n\w+: $", re.DOTALL)
+
+
+def _prompt_from_parts(system, user):
+    """Rebuild the Prompt a request was written from, so wrappers see its template and sentence"""
+    if system is None:
+        return user
+    match = _SENTENCE_PATTERN.search(user)
+    sentence = (match.group(1) if match.group(1) is not None else match.group(2)) if match else None
+    return Prompt(system, user, sentence)
+
+
+class LocalBatchRunner:
+    """Stand-in batch service: answers a requests file line by line with an LLM wrapper.
+
+    Any object with `generate(text, fmt)` works, e.g. benchmark.StubLLM, so
+    batch mode runs without uploading anything. Each line is answered with the
+    Prompt (template and sentence) it was written from.
+    """
+
+    def __init__(self, llm, provider='openai'):
+        self.llm = llm
+        self.provider = provider
+
+    def run(self, requests_path, results_path):
+        with open(requests_path, "r", encoding="utf-8") as f, open(results_path, "w", encoding="utf-8") as out:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if self.provider == 'openai':
+                    body = entry["body"]
+                    parts = {m["role"]: m["content"] for m in body["messages"]}
+                    prompt = _prompt_from_parts(parts.get("system"), parts["user"])
+                    fmt = SCHEMAS[body["response_format"]["json_schema"]["name"]]
+                else:
+                    request = entry["request"]
+                    system = request.get("system_instruction", {}).get("parts", [])
+                    prompt = _prompt_from_parts(
+                        "".join(p["text"] for p in system) if system else None,
+                        "".join(p["text"] for p in request["contents"][-1]["parts"])
+                    )
+                    fmt = SCHEMAS[request["generation_config"]["response_json_schema"]["title"]]
+                try:
+                    text = self.llm.generate(prompt, fmt).model_dump_json()
+                    error = None
+                except Exception as e:
+                    text, error = None, {"message": str(e)}
+
+                if self.provider == 'openai':
+                    result = {
+                        "custom_id": entry["custom_id"],
+                        "response": None if error else {"status_code": 200, "body": {"choices": [{"message": {"content": text}}]}},
+                        "error": error
+                    }
+                else:
+                    result = {"key": entry["key"]}
+                    if error:
+                        result["error"] = error
+                    else:
+                        result["response"] = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+class OpenAIBatchRunner:
+    """Submits a requests file to the OpenAI Batch API and waits for its results"""
+
+    def __init__(self, client=None, poll_interval=30, completion_window="24h"):
+        if client is None:
+            from clients import get_openai_client
+            client = get_openai_client()
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def run(self, requests_path, results_path):
+        with open(requests_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        job = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        while job.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(self.poll_interval)
+            job = self.client.batches.retrieve(job.id)
+        if job.status != "completed" or job.output_file_id is None:
+            raise RuntimeError(f"Batch {job.id} ended with status {job.status}")
+        content = self.client.files.content(job.output_file_id).text
+        with open(results_path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+class GeminiBatchRunner:
+    """Submits a requests file to the Gemini Batch API and waits for its results"""
+
+    def __init__(self, model, client=None, poll_interval=30):
+        if client is None:
+            from clients import get_gemini_client
+            client = get_gemini_client()
+        self.model = model
+        self.client = client
+        self.poll_interval = poll_interval
+
+    def run(self, requests_path, results_path):
+        from google.genai import types
+        uploaded = self.client.files.upload(file=str(requests_path), config=types.UploadFileConfig(mime_type="jsonl"))
+        job = self.client.batches.create(model=self.model, src=uploaded.name)
+        done = ("JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED")
+        while job.state.name not in done:
+            time.sleep(self.poll_interval)
+            job = self.client.batches.get(name=job.name)
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Batch {job.name} ended with state {job.state.name}")
+        content = self.client.files.download(file=job.dest.file_name)
+        with open(results_path, "wb") as f:
+            f.write(content)
+
+
+class BatchPipeline:
+    """Offline batch execution of the parse cascade.
+
+    Every pending node of every rule is advanced one call per level: the
+    prompts of a level are written as one batch JSONL file, the runner turns
+    it into a results file, and the responses expand the next level.
+    Identical prompts within a level are sent once.
+
+    Nodes deeper than budget.max_depth are kept as opaque clauses, like the
+    sentence budget of Pipeline. After max_levels levels the rules that are
+    still pending fail with BudgetExceeded, so a model that keeps splitting
+    operands cannot submit paid batches forever.
+    """
+
+    def __init__(self, model, provider='openai', runner=None, work_dir=None, max_levels=64, budget=None):
+        if provider not in ('openai', 'gemini'):
+            raise ValueError("Batch provider is not valid")
+        if runner is None:
+            runner = OpenAIBatchRunner() if provider == 'openai' else GeminiBatchRunner(model)
+        if work_dir is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            work_dir = Path(".batch") / timestamp
+        self.model = model
+        self.provider = provider
+        self.runner = runner
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.max_levels = max_levels
+        self.budget = budget
+        self.levels = 0
+        self.requests_sent = 0
+
+    def rephrase_and_parse_all(self, texts):
+        """Parse every text; returns one tree or Exception per input, in order"""
+        roots = [_Job('rephrase', text) for text in texts]
+        failed = {}
+        pending = [(i, job) for i, job in enumerate(roots)]
+        max_depth = self.budget.max_depth if self.budget is not None else None
+
+        for _ in range(self.max_levels):
+            if not pending:
+                break
+            requests = {}
+            keyed = []
+            for i, job in pending:
+                prompt, fmt = job.prompt()
+                custom_id = _request_id(prompt, fmt)
+                requests[custom_id] = (prompt, fmt)
+                keyed.append((i, job, custom_id, fmt))
+
+            requests_path = self.work_dir / f"level_{self.levels:03d}_requests.jsonl"
+            results_path = self.work_dir / f"level_{self.levels:03d}_results.jsonl"
+            write_requests(requests_path, requests, self.model, self.provider)
+            self.runner.run(requests_path, results_path)
+            results = read_results(results_path, self.provider)
+            self.levels += 1
+            self.requests_sent += len(requests)
+
+            pending = []
+            for i, job, custom_id, fmt in keyed:
+                if i in failed:
+                    continue
+                try:
+                    text = results.get(custom_id, KeyError(f"No result for request {custom_id}"))
+                    if isinstance(text, Exception):
+                        raise text
+                    pending.extend((i, child) for child in job.advance(fmt.model_validate_json(text)))
+                except Exception as e:
+                    failed[i] = e
+            pending = [(i, job) for i, job in pending if i not in failed]
+            for i, job in pending:
+                if max_depth is not None and job.depth > max_depth:
+                    job.collapse(f"sentence max_depth={max_depth}")
+            pending = [(i, job) for i, job in pending if job.stage != 'done']
+
+        for i, job in pending:
+            failed.setdefault(i, BudgetExceeded(f"batch max_levels={self.max_levels}"))
+
+        return [failed[i] if i in failed else roots[i].build() for i in range(len(roots))]
+
+    def parse_contracts(self, contracts):
+        """Parse the trigger conditions of all rules of all contracts in shared batches.
+
+        Returns {contractName: [tree or Exception per penalty rule]}.
+        """
+        texts, index = [], []
+        for contract in contracts:
+            for rule in contract['penaltyRules']:
+                texts.append(rule.get('action', {}).get('triggerCond'))
+                index.append(contract['contractName'])
+        trees = self.rephrase_and_parse_all(texts)
+        output = {contract['contractName']: [] for contract in contracts}
+        for name, tree in zip(index, trees):
+            output[name].append(tree)
+        return output
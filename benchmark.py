@@ -0,0 +1,433 @@
+import io
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import contextlib
+from pathlib import Path
+
+from pipeline import Pipeline, AsyncPipeline
+from ast_rl import BinaryOperator, UnaryOperator, QuantifiedSentence, Constant, Variable
+from structured_output import *
+from extractDeontic import extractDeontic
+from llm_cache import LLMCache
+from metrics import report_usage
+from resilience import ResiliencePolicy
+
+STRATEGIES = ("sequential", "async", "fused", "oneshot", "cached", "speculative")
+
+_QUANTIFIER_WORDS = {"every", "each", "all", "any"}
+_NEGATIONS = (" does not ", " do not ", " not ", " fails to ", " no ")
+
+
+class StubError(Exception):
+    """Injected provider failure; looks like a 503 so ResilientLLM retries it"""
+    status_code = 503
+
+
+def _decompose(sentence):
+    """Deterministic stand-in for the LLM's reading of a sentence.
+
+    Returns ("binary", op, left, right), ("unary", operand),
+    ("quantified", quantifier, variable, rest) or ("relation", kind, fields).
+    """
+    s = sentence.strip().rstrip(".")
+    lower = s.lower()
+    if lower.startswith("if ") and ", " in s:
+        condition, consequence = s[3:].split(", ", 1)
+        return ("binary", "If", condition, consequence)
+    for word, op in ((" and ", "And"), (" or ", "Or")):
+        if word in lower:
+            i = lower.index(word)
+            return ("binary", op, s[:i], s[i + len(word):])
+    for negation in _NEGATIONS:
+        if negation in lower:
+            i = lower.index(negation)
+            return ("unary", s[:i] + " " + s[i + len(negation):])
+    words = s.split()
+    if len(words) > 3 and words[0].lower() in _QUANTIFIER_WORDS:
+        return ("quantified", "ForAll", "x", " ".join(["x"] + words[2:]))
+    if len(words) <= 2:
+        return ("relation", "intransitive", {"subject": words[0] if words else "it", "verb": words[-1] if words else "is"})
+    if words[1] in ("is", "are") and len(words) == 3:
+        return ("relation", "adjective", {"obj": words[0], "adjective": words[2]})
+    if "to" in words[3:]:
+        i = words.index("to", 3)
+        return ("relation", "ditransitive", {
+            "subject": words[0], "verb": words[1],
+            "direct_obj": " ".join(words[2:i]), "indirect_obj": " ".join(words[i + 1:]) or "someone"
+        })
+    return ("relation", "transitive", {"subject": words[0], "verb": words[1], "obj": " ".join(words[2:])})
+
+
+_RELATION_ANSWERS = {"adjective": "A", "intransitive": "B", "transitive": "C", "ditransitive": "D"}
+_RELATION_TYPES = {"adjective": AdjectiveParser, "intransitive": IntransitiveParser,
+                   "transitive": TransitiveParser, "ditransitive": DitransitiveParser}
+_ARGUMENTS = {"adjective": ["obj"], "intransitive": ["subject"], "transitive": ["subject", "obj"],
+              "ditransitive": ["subject", "indirect_obj", "direct_obj"]}
+
+
+def _oneshot_nodes(sentence, nodes):
+    index = len(nodes)
+    d = _decompose(sentence)
+    nodes.append(None)
+    if d[0] == "binary":
+        node = FormulaNode(kind="binary", text=sentence, operator=d[1],
+                           children=[_oneshot_nodes(d[2], nodes), _oneshot_nodes(d[3], nodes)])
+    elif d[0] == "unary":
+        node = FormulaNode(kind="unary", text=sentence, operator="Not", children=[_oneshot_nodes(d[1], nodes)])
+    elif d[0] == "quantified":
+        node = FormulaNode(kind="quantified", text=sentence, quantifier=d[1], variable=d[2],
+                           children=[_oneshot_nodes(d[3], nodes)])
+    else:
+        kind, fields = d[1], d[2]
+        predicate = fields["adjective"] if kind == "adjective" else fields["verb"]
+        node = FormulaNode(kind=kind, text=sentence, predicate=predicate,
+                           arguments=[fields[a] for a in _ARGUMENTS[kind]])
+    nodes[index] = node
+    return index
+
+
+class StubLLM:
+    """Local stand-in for a provider with configurable latency and failure rate.
+
+    Answers every prompt type the pipeline sends from a rule-based reading of
+    the sentence, so runs are deterministic and need no network.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.2, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delay(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        return max(0.0, delay), fail
+
+    def _answer(self, text, fmt):
+        sentence = getattr(text, "sentence", None) or str(text)
+        d = _decompose(sentence)
+        if fmt is Rephrased:
+            response = Rephrased(rephrased=sentence)
+        elif fmt is ChooseParser:
+            response = ChooseParser(answer={"relation": "A", "quantified": "B", "binary": "C", "unary": "D"}[d[0]])
+        elif fmt is ChooseRelation:
+            response = ChooseRelation(answer=_RELATION_ANSWERS[d[1]] if d[0] == "relation" else "C")
+        elif fmt is QuantifiedParser:
+            response = QuantifiedParser(quantifier=d[1], variable=d[2], sentence_without_quantifier=d[3]) \
+                if d[0] == "quantified" else QuantifiedParser(quantifier="ForAll", variable="x", sentence_without_quantifier=sentence)
+        elif fmt is BinaryLogicalParser:
+            response = BinaryLogicalParser(operator=d[1], left_operand=d[2], right_operand=d[3]) \
+                if d[0] == "binary" else BinaryLogicalParser(operator="And", left_operand=sentence, right_operand=sentence)
+        elif fmt is UnaryLogicalParser:
+            response = UnaryLogicalParser(operator="Not", operand=d[1] if d[0] == "unary" else sentence)
+        elif fmt in _RELATION_TYPES.values():
+            kind = next(k for k, t in _RELATION_TYPES.items() if t is fmt)
+            fields = d[2] if d[0] == "relation" and d[1] == kind else _decompose_as(sentence, kind)
+            response = fmt(**fields)
+        elif fmt is FusedParser:
+            if d[0] == "binary":
+                node = dict(kind="binary", operator=d[1], left_operand=d[2], right_operand=d[3])
+            elif d[0] == "unary":
+                node = dict(kind="unary", operator="Not", operand=d[1])
+            elif d[0] == "quantified":
+                node = dict(kind="quantified", quantifier=d[1], variable=d[2], sentence_without_quantifier=d[3])
+            else:
+                node = dict(kind=d[1], **d[2])
+            response = FusedParser(node=node)
+        elif fmt is OneShotParser:
+            nodes = []
+            _oneshot_nodes(sentence, nodes)
+            response = OneShotParser(nodes=nodes)
+        else:
+            raise ValueError(f"StubLLM cannot answer {fmt}")
+        report_usage(len(str(text)) // 4, len(response.model_dump_json()) // 4)
+        return response
+
+    def generate(self, text, fmt):
+        delay, fail = self._delay()
+        time.sleep(delay)
+        if fail:
+            raise StubError("Injected failure")
+        return self._answer(text, fmt)
+
+    async def agenerate(self, text, fmt):
+        delay, fail = self._delay()
+        await asyncio.sleep(delay)
+        if fail:
+            raise StubError("Injected failure")
+        return self._answer(text, fmt)
+
+
+def _decompose_as(sentence, kind):
+    words = sentence.split() or ["it"]
+    rest = " ".join(words[2:]) or words[-1]
+    if kind == "adjective":
+        return {"obj": words[0], "adjective": words[-1]}
+    if kind == "intransitive":
+        return {"subject": words[0], "verb": words[1] if len(words) > 1 else words[0]}
+    if kind == "transitive":
+        return {"subject": words[0], "verb": words[1] if len(words) > 1 else words[0], "obj": rest}
+    return {"subject": words[0], "verb": words[1] if len(words) > 1 else words[0], "direct_obj": rest, "indirect_obj": rest}
+
+
+def tree_depth(node):
+    """Logical depth of a parsed formula; a single relation has depth 1"""
+    if isinstance(node, (BinaryOperator, UnaryOperator, QuantifiedSentence)):
+        children = [c for c in node.getChild() if not isinstance(c, (Constant, Variable))]
+        return 1 + max((tree_depth(c) for c in children), default=0)
+    return 1
+
+
+_SUBJECTS = ["The company", "The renter", "The hotel", "The supplier", "The customer"]
+_VERBS = ["provides", "delivers", "refunds", "waives", "offers", "replaces"]
+_OBJECTS = ["an upgraded model", "the deposit", "all insurance costs", "a free night", "the booked room"]
+
+
+def synthetic_rules(n, seed=0):
+    """Trigger conditions built from clause templates, for corpora larger than Extracted/"""
+    rng = random.Random(seed)
+
+    def clause():
+        c = f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}"
+        return c.replace(" provides ", " does not provide ") if rng.random() < 0.3 else c
+
+    rules = []
+    for _ in range(n):
+        shape = rng.random()
+        if shape < 0.3:
+            rules.append(clause())
+        elif shape < 0.6:
+            rules.append(f"{clause()} and {clause()}")
+        elif shape < 0.8:
+            rules.append(f"If {clause()}, {clause()} or {clause()}")
+        else:
+            rules.append(f"Every customer {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}")
+    return rules
+
+
+def load_contracts(paths=("Extracted",)):
+    """Contract schemas saved by generate_schema (Extracted/<name>/<name>.json)"""
+    contracts = []
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.glob("*/*.json")) if path.is_dir() else [path]
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if "penaltyRules" in data:
+                contracts.append(data)
+    return contracts
+
+
+def _synthetic_contract(rules):
+    return {
+        "contractName": "Synthetic",
+        "involvedParties": [],
+        "penaltyRules": [{"representor": "", "deonticType": "Failing Which",
+                          "action": {"description": "", "triggerCond": r, "note": ""}} for r in rules]
+    }
+
+
+def _make_pipeline(strategy, stub, work_dir, cls=Pipeline):
+    kwargs = dict(llm=stub, model="stub", memo=False, metrics=True,
+                  resilience=ResiliencePolicy(max_retries=5, base_delay=0.01, max_delay=0.1))
+    if strategy == "fused":
+        kwargs["strategy"] = "fused"
+    elif strategy == "oneshot":
+        kwargs["strategy"] = "oneshot"
+    elif strategy == "cached":
+        kwargs["cache"] = LLMCache(Path(work_dir) / "llm_cache.sqlite")
+    elif strategy == "speculative":
+        kwargs["speculative"] = True
+    return cls(**kwargs)
+
+
+def _instrument(pipeline, samples):
+    """Time every rephrase_and_parse call and keep its tree"""
+    inner = pipeline.rephrase_and_parse
+
+    def timed(text):
+        start = time.perf_counter()
+        try:
+            tree = inner(text)
+        except Exception as e:
+            samples.append({"seconds": time.perf_counter() - start, "depth": None, "error": type(e).__name__})
+            raise
+        samples.append({"seconds": time.perf_counter() - start, "depth": tree_depth(tree), "error": None})
+        return tree
+
+    pipeline.rephrase_and_parse = timed
+
+
+async def _run_async(pipeline, rules, concurrency, samples):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(text):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                tree = await pipeline.rephrase_and_parse(text)
+            except Exception as e:
+                samples.append({"seconds": time.perf_counter() - start, "depth": None, "error": type(e).__name__})
+                return
+            samples.append({"seconds": time.perf_counter() - start, "depth": tree_depth(tree), "error": None})
+
+    await asyncio.gather(*(one(r) for r in rules))
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def run_strategy(strategy, contracts, latency=0.05, jitter=0.2, failure_rate=0.0, concurrency=16, seed=0):
+    """Run the corpus through one strategy and return its result row"""
+    rules = [r["action"]["triggerCond"] for c in contracts for r in c["penaltyRules"] if r.get("action", {}).get("triggerCond")]
+    with tempfile.TemporaryDirectory() as work_dir:
+        if strategy == "cached":
+            # Warm the response cache first; the timed pass measures the hit path
+            warm = _make_pipeline(strategy, StubLLM(latency, jitter, failure_rate, seed), work_dir)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for contract in contracts:
+                    extractDeontic(contract, warm).extract_deontic_from_data()
+            warm.cache.close()
+
+        stub = StubLLM(latency, jitter, failure_rate, seed)
+        samples = []
+        tracemalloc.start()
+        start = time.perf_counter()
+        if strategy == "async":
+            pipeline = _make_pipeline(strategy, stub, work_dir, AsyncPipeline)
+            asyncio.run(_run_async(pipeline, rules, concurrency, samples))
+        else:
+            pipeline = _make_pipeline(strategy, stub, work_dir)
+            _instrument(pipeline, samples)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for contract in contracts:
+                    extractDeontic(contract, pipeline).extract_deontic_from_data()
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if pipeline.cache is not None:
+            pipeline.cache.close()
+
+    parsed = [s for s in samples if s["error"] is None]
+    seconds = [s["seconds"] for s in samples]
+    stages = {}
+    for row in pipeline.metrics.snapshot():
+        stages[row["template"]] = {
+            "calls": row["calls"],
+            "errors": row["errors"],
+            "retries": row["retries"],
+            "latency_total": round(row["latency_total"], 4),
+            "latency_p50": round(row["latency_p50"], 4),
+            "latency_p95": round(row["latency_p95"], 4),
+        }
+    result = {
+        "rules": len(rules),
+        "parsed": len(parsed),
+        "failed": len(samples) - len(parsed),
+        "llm_calls": stub.calls,
+        "injected_failures": stub.failures,
+        "calls_per_rule": stub.calls / len(rules) if rules else 0.0,
+        "depth_mean": sum(s["depth"] for s in parsed) / len(parsed) if parsed else 0.0,
+        "depth_max": max((s["depth"] for s in parsed), default=0),
+        "wall_seconds": wall,
+        "rules_per_second": len(rules) / wall if wall else 0.0,
+        "rule_p50_seconds": _percentile(seconds, 50),
+        "rule_p95_seconds": _percentile(seconds, 95),
+        "peak_memory_bytes": peak,
+        "stages": stages,
+    }
+    if pipeline.speculator is not None:
+        result["speculation"] = pipeline.speculator.stats()
+        pipeline.speculator.close()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmark(strategies=STRATEGIES, contracts=None, synthetic=0, repeat=1, **options):
+    contracts = list(contracts if contracts is not None else load_contracts())
+    if synthetic:
+        contracts.append(_synthetic_contract(synthetic_rules(synthetic, options.get("seed", 0))))
+    contracts = contracts * repeat
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "options": dict(options, synthetic=synthetic, repeat=repeat),
+        "results": {s: run_strategy(s, contracts, **options) for s in strategies}
+    }
+
+
+def summary(report, baseline=None):
+    """Table of the headline numbers, with relative change against a baseline report"""
+    lines = [f"{'strategy':<13}{'rules':>6}{'fail':>6}{'calls/rule':>11}{'depth':>7}{'wall s':>9}{'rules/s':>9}{'p95 s':>8}{'peak MB':>9}"]
+    for strategy, r in report["results"].items():
+        line = (f"{strategy:<13}{r['rules']:>6}{r['failed']:>6}{r['calls_per_rule']:>11.2f}{r['depth_mean']:>7.2f}"
+                f"{r['wall_seconds']:>9.3f}{r['rules_per_second']:>9.2f}{r['rule_p95_seconds']:>8.3f}"
+                f"{r['peak_memory_bytes'] / 2 ** 20:>9.2f}")
+        old = (baseline or {}).get("results", {}).get(strategy)
+        if old and old["rules_per_second"]:
+            change = (r["rules_per_second"] - old["rules_per_second"]) / old["rules_per_second"]
+            line += f"  {change:+.1%} rules/s vs {baseline.get('commit') or 'baseline'}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline against a local stub LLM")
+    parser.add_argument("contracts", nargs="*", default=["Extracted"], help="Contract JSON files or directories")
+    parser.add_argument("-s", "--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean stub latency per call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls failing with a retryable error")
+    parser.add_argument("--concurrency", type=int, default=16, help="Rules in flight for the async strategy")
+    parser.add_argument("--synthetic", type=int, default=0, help="Extra generated trigger conditions")
+    parser.add_argument("--repeat", type=int, default=1, help="Run the corpus this many times")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None, help="Result file (default .bench/bench_<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.strategies, load_contracts(args.contracts), args.synthetic, args.repeat,
+        latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        concurrency=args.concurrency, seed=args.seed
+    )
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(summary(report, baseline))
+
+    output = Path(args.output or Path(".bench") / f"bench_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Saved to: {output}")
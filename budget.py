@@ -0,0 +1,117 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Budget state of the sentence / contract being parsed. Pipeline opens the
+# scopes and BudgetedLLM charges every provider call against both.
+_sentence_state = contextvars.ContextVar("sentence_budget", default=None)
+_contract_state = contextvars.ContextVar("contract_budget", default=None)
+
+
+class BudgetExceeded(Exception):
+    """A parse budget ran out; the pipeline collapses the current subtree"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ParseBudget:
+    """Limits for one sentence or one contract; None means unlimited"""
+
+    def __init__(self, max_calls=None, max_depth=None, max_seconds=None):
+        self.max_calls = max_calls
+        self.max_depth = max_depth
+        self.max_seconds = max_seconds
+
+
+class _BudgetState:
+    def __init__(self, budget, scope):
+        self.budget = budget
+        self.scope = scope
+        self.calls = 0
+        self.started_at = time.monotonic()
+        self.collapsed = []  # (clause, reason)
+        self._lock = threading.Lock()
+
+    def exhausted(self, depth=None):
+        """Reason string if the budget is used up, else None"""
+        b = self.budget
+        if b.max_calls is not None and self.calls >= b.max_calls:
+            return f"{self.scope} max_calls={b.max_calls}"
+        if b.max_seconds is not None and time.monotonic() - self.started_at >= b.max_seconds:
+            return f"{self.scope} max_seconds={b.max_seconds}"
+        if depth is not None and b.max_depth is not None and depth > b.max_depth:
+            return f"{self.scope} max_depth={b.max_depth}"
+        return None
+
+    def charge(self):
+        with self._lock:
+            reason = self.exhausted()
+            if reason is None:
+                self.calls += 1
+            return reason
+
+
+def _states():
+    return [s for s in (_sentence_state.get(), _contract_state.get()) if s is not None]
+
+
+def exhausted(depth=None):
+    """Reason the current sentence or contract budget is used up, else None"""
+    for state in _states():
+        reason = state.exhausted(depth)
+        if reason is not None:
+            return reason
+    return None
+
+
+def record_collapse(clause, reason):
+    for state in _states():
+        with state._lock:
+            state.collapsed.append((clause, reason))
+
+
+@contextmanager
+def sentence_scope(budget):
+    token = _sentence_state.set(_BudgetState(budget, "sentence") if budget is not None else None)
+    try:
+        yield _sentence_state.get()
+    finally:
+        _sentence_state.reset(token)
+
+
+@contextmanager
+def contract_scope(budget):
+    token = _contract_state.set(_BudgetState(budget, "contract") if budget is not None else None)
+    try:
+        yield _contract_state.get()
+    finally:
+        _contract_state.reset(token)
+
+
+class BudgetedLLM:
+    """Wrapper charging each provider call to the active budgets; raises BudgetExceeded when one is spent"""
+
+    def __init__(self, llm_wrapper):
+        self.wrapper = llm_wrapper
+
+    def _charge(self):
+        states = _states()
+        for state in states:
+            reason = state.exhausted()
+            if reason is not None:
+                raise BudgetExceeded(reason)
+        for state in states:
+            reason = state.charge()
+            if reason is not None:
+                raise BudgetExceeded(reason)
+
+    def generate(self, text, fmt):
+        self._charge()
+        return self.wrapper.generate(text, fmt)
+
+    async def agenerate(self, text, fmt):
+        self._charge()
+        return await self.wrapper.agenerate(text, fmt)
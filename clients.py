@@ -0,0 +1,137 @@
+import os
+import asyncio
+import weakref
+import threading
+
+# Keep-alive connection pools shared by every wrapper and by generate_schema.
+# Clients are keyed on backend, endpoint and limits, so wrappers with the same
+# configuration reuse one pool instead of paying TCP/TLS setup per call.
+# Async clients are bound to the event loop that uses them, so they are kept
+# per running loop; close them with `await aclose_all()` before the loop ends.
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_TIMEOUT = 60  # seconds
+KEEPALIVE_EXPIRY = 30  # seconds an idle connection is kept open
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {key: client}
+_lock = threading.Lock()
+
+
+def _limits(max_connections):
+    import httpx
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def _get(key, factory, asynchronous=False):
+    with _lock:
+        if asynchronous:
+            clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        else:
+            clients = _clients
+        client = clients.get(key)
+        if client is None:
+            client = factory()
+            clients[key] = client
+        return client
+
+
+def get_openai_client(base_url=None, max_connections=None, timeout=None, asynchronous=False):
+    """Shared OpenAI client; base_url points it at an OpenAI-compatible server such as vLLM"""
+    from openai import OpenAI, AsyncOpenAI
+
+    max_connections = max_connections or DEFAULT_MAX_CONNECTIONS
+    timeout = timeout or DEFAULT_TIMEOUT
+    key = ("openai", base_url, max_connections, timeout)
+
+    def factory():
+        import httpx
+        if asynchronous:
+            http_client = httpx.AsyncClient(limits=_limits(max_connections), timeout=timeout)
+            return AsyncOpenAI(base_url=base_url, timeout=timeout, http_client=http_client)
+        http_client = httpx.Client(limits=_limits(max_connections), timeout=timeout)
+        return OpenAI(base_url=base_url, timeout=timeout, http_client=http_client)
+
+    return _get(key, factory, asynchronous)
+
+
+def get_ollama_client(host=None, max_connections=None, timeout=None, asynchronous=False):
+    from ollama import Client, AsyncClient
+
+    max_connections = max_connections or DEFAULT_MAX_CONNECTIONS
+    timeout = timeout or DEFAULT_TIMEOUT
+    key = ("ollama", host, max_connections, timeout)
+
+    def factory():
+        cls = AsyncClient if asynchronous else Client
+        return cls(host=host, timeout=timeout, limits=_limits(max_connections))
+
+    return _get(key, factory, asynchronous)
+
+
+def get_gemini_client(api_key=None, max_connections=None, timeout=None, asynchronous=False):
+    """Shared google-genai client; its `.aio` side uses a pool with the same limits.
+
+    Use the `.aio` side only of a client fetched with asynchronous=True, which
+    is kept per running event loop.
+    """
+    from google import genai
+    from google.genai import types
+
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    max_connections = max_connections or DEFAULT_MAX_CONNECTIONS
+    timeout = timeout or DEFAULT_TIMEOUT
+    key = ("gemini", api_key, max_connections, timeout)
+
+    def factory():
+        import httpx
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                timeout=int(timeout * 1000),  # milliseconds
+                client_args={"limits": _limits(max_connections)},
+                # An explicit transport keeps the async side on pooled httpx (not aiohttp)
+                async_client_args={"transport": httpx.AsyncHTTPTransport(limits=_limits(max_connections))}
+            )
+        )
+
+    return _get(key, factory, asynchronous)
+
+
+def close_all():
+    """Close every pooled synchronous client; async clients are closed by aclose_all()"""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None and not _is_async(client):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+async def aclose_all():
+    """Close the async clients of the running event loop; call it before the loop ends"""
+    with _lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        # AsyncOpenAI.close(), genai's client.aio.aclose(), ollama's inner httpx client
+        targets = ((client, "close"), (getattr(client, "aio", None), "aclose"), (getattr(client, "_client", None), "aclose"))
+        for target, name in targets:
+            close = getattr(target, name, None)
+            if close is not None and _is_async(target, name):
+                try:
+                    await close()
+                except Exception:
+                    pass
+                break
+
+
+def _is_async(client, name="close"):
+    import inspect
+    return inspect.iscoroutinefunction(getattr(client, name, None))
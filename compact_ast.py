@@ -0,0 +1,205 @@
+import sys
+from ast_rl import NODE_TYPES
+
+# Per node type: the string fields (attrs) and the subtree fields (children),
+# in storage order. "sentences" of RelationalLogic is the only list field.
+LAYOUT = {
+    "Constant": (("name",), ()),
+    "Variable": (("name",), ()),
+    "RelationAdjective": (("adjective",), ("obj",)),
+    "RelationIntransitiveVerb": (("verb",), ("subject",)),
+    "RelationTransitiveVerb": (("verb",), ("subject", "obj")),
+    "RelationDitransitiveVerb": (("verb",), ("subject", "direct_obj", "indirect_obj")),
+    "RelationOpaque": (("clause", "reason"), ()),
+    "BinaryOperator": (("operator",), ("left", "right")),
+    "UnaryOperator": (("operator",), ("sentence",)),
+    "QuantifiedSentence": (("quantifier",), ("variable", "sentence")),
+    "RelationalLogic": (("original_sentence",), ("sentences",)),
+}
+LIST_FIELDS = {"sentences"}
+
+_OPERATORS = {"And": "∧", "Or": "∨", "If": "→", "OnlyIf": "←", "IfAndOnlyIf": "↔"}
+_QUANTIFIERS = {"ForAll": "∀", "ThereExists": "∃"}
+
+
+class Node:
+    """Immutable AST node: type name, string fields and child nodes, all as tuples.
+
+    Built through an Interner, equal subtrees are one shared object, so
+    structural equality is mostly an identity check and the hash is computed once.
+    """
+    __slots__ = ("kind", "attrs", "children", "_hash")
+
+    def __init__(self, kind, attrs=(), children=()):
+        self.kind = kind
+        self.attrs = attrs
+        self.children = children
+        self._hash = hash((kind, attrs, children))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Node) or self._hash != other._hash:
+            return False
+        return self.kind == other.kind and self.attrs == other.attrs and self.children == other.children
+
+    def __getattr__(self, name):
+        # Field access by the pydantic field name, e.g. node.verb or node.left
+        layout = LAYOUT.get(object.__getattribute__(self, "kind"))
+        if layout is not None:
+            if name in layout[0]:
+                return self.attrs[layout[0].index(name)]
+            if name in LIST_FIELDS and name in layout[1]:
+                return self.children
+            if name in layout[1]:
+                return self.children[layout[1].index(name)]
+        raise AttributeError(name)
+
+    def getChild(self):
+        return list(self.children)
+
+    def __str__(self):
+        kind, a, c = self.kind, self.attrs, self.children
+        if kind in ("Constant", "Variable"):
+            return a[0]
+        if kind == "RelationDitransitiveVerb":
+            # Same argument order as RelationDitransitiveVerb.__str__
+            return f"{a[0]}({c[0]},{c[2]},{c[1]})"
+        if kind.startswith("Relation") and kind not in ("RelationOpaque", "RelationalLogic"):
+            return f"{a[0]}({','.join(str(child) for child in c)})"
+        if kind == "RelationOpaque":
+            return f"⟦{a[0]}⟧"
+        if kind == "BinaryOperator":
+            return f"({c[0]}) {_OPERATORS[a[0]]} ({c[1]})"
+        if kind == "UnaryOperator":
+            return f"¬({c[0]})"
+        if kind == "QuantifiedSentence":
+            return f"{_QUANTIFIERS[a[0]]}{c[0]}. ({c[1]})"
+        return "".join(f"{child}\n" for child in c)
+
+    def __repr__(self):
+        return f"Node({self.kind!r}, {self.attrs!r}, {len(self.children)} children)"
+
+
+class Interner:
+    """Hash-consing table: every distinct (kind, attrs, children) is stored once.
+
+    Strings are interned with sys.intern, so repeated names such as
+    "Car booking company" are also one object across all formulas.
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self.requests = 0
+
+    def node(self, kind, attrs=(), children=()):
+        self.requests += 1
+        kind = sys.intern(kind)
+        attrs = tuple(sys.intern(a) for a in attrs)
+        key = (kind, attrs, children)
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = Node(kind, attrs, children)
+        return node
+
+    def clear(self):
+        self._nodes.clear()
+        self.requests = 0
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "unique_nodes": len(self._nodes),
+            "shared": 1 - len(self._nodes) / self.requests if self.requests else 0.0
+        }
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+_default_interner = Interner()
+
+
+def default_interner():
+    return _default_interner
+
+
+def from_model(model, interner=None):
+    """Compact copy of an ast_rl pydantic tree"""
+    interner = interner or _default_interner
+    memo = {}
+
+    def convert(m):
+        found = memo.get(id(m))
+        if found is not None:
+            return found
+        kind = type(m).__name__
+        attr_fields, child_fields = LAYOUT[kind]
+        children = []
+        for field in child_fields:
+            value = getattr(m, field)
+            if field in LIST_FIELDS:
+                children.extend(convert(v) for v in value)
+            else:
+                children.append(convert(value))
+        node = interner.node(kind, tuple(getattr(m, f) for f in attr_fields), tuple(children))
+        memo[id(m)] = node
+        return node
+
+    return convert(model)
+
+
+def to_model(node):
+    """Equivalent ast_rl pydantic tree; shared subtrees are converted once"""
+    memo = {}
+
+    def convert(n):
+        found = memo.get(id(n))
+        if found is not None:
+            return found
+        attr_fields, child_fields = LAYOUT[n.kind]
+        fields = dict(zip(attr_fields, n.attrs))
+        if child_fields and child_fields[0] in LIST_FIELDS:
+            fields[child_fields[0]] = [convert(c) for c in n.children]
+        else:
+            fields.update(zip(child_fields, (convert(c) for c in n.children)))
+        model = memo[id(n)] = NODE_TYPES[n.kind](**fields)
+        return model
+
+    return convert(node)
+
+
+def from_dict(data, interner=None):
+    """Compact tree straight from ast_rl to_dict() output, without building pydantic models"""
+    interner = interner or _default_interner
+
+    def convert(d):
+        kind = d["node_type"]
+        if kind not in LAYOUT:
+            raise ValueError(f"Unknown node type: {kind}")
+        attr_fields, child_fields = LAYOUT[kind]
+        children = []
+        for field in child_fields:
+            if field in LIST_FIELDS:
+                children.extend(convert(v) for v in d[field])
+            else:
+                children.append(convert(d[field]))
+        return interner.node(kind, tuple(d.get(f, "") for f in attr_fields), tuple(children))
+
+    return convert(data)
+
+
+def to_dict(node):
+    """Same shape as the ast_rl to_dict() of the equivalent model"""
+    attr_fields, child_fields = LAYOUT[node.kind]
+    data = {"node_type": node.kind}
+    data.update(zip(attr_fields, node.attrs))
+    if child_fields and child_fields[0] in LIST_FIELDS:
+        data[child_fields[0]] = [to_dict(c) for c in node.children]
+        data["text"] = str(node)
+    else:
+        data.update(zip(child_fields, (to_dict(c) for c in node.children)))
+    return data
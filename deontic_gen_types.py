@@ -1,4 +1,5 @@
 from typing import TypedDict, Literal
+from pydantic import BaseModel, Field
 
 
 class Party(TypedDict):
@@ -24,4 +25,51 @@ class Contract(TypedDict):
     """Main contract structure"""
     contractName: str
     involvedParties: list[Party]
-    penaltyRules: list[PenaltyRule]
\ No newline at end of file
+    penaltyRules: list[PenaltyRule]
+
+# Pydantic mirrors of the TypedDicts above. generate_schema sends them as the
+# provider's response schema (constrained decoding), so the field descriptions
+# replace the output schema that used to be pasted into the prompt.
+class PartyOutput(BaseModel):
+    name: str = Field(description="Name of the party, e.g. Hotel, Customer.")
+
+
+class ActionOutput(BaseModel):
+    description: str = Field(description="A concise, high-level summary of the obligation or fallback action. Rephrase for clarity while maintaining intent.")
+    triggerCond: str = Field(description="The specific failure or condition of the PREVIOUS step that triggers this action. Must be self-contained, using specific nouns/parties instead of pronouns.")
+    note: str = Field(description="The verbatim or detailed technical constraints of the rule. Include specific values, timeframes, or 'OR' conditions.")
+
+
+class PenaltyRuleOutput(BaseModel):
+    representor: str = Field(description="The party executing this action.")
+    deonticType: Literal["Failing Which", "LCTC"]
+    action: ActionOutput
+
+
+class ContractOutput(BaseModel):
+    contractName: str
+    involvedParties: list[PartyOutput]
+    penaltyRules: list[PenaltyRuleOutput] = Field(description="Fallback actions in order of execution; the last one is the LCTC.")
+
+
+def contract_problems(contract: ContractOutput, window=False) -> list[str]:
+    """Checks the response schema cannot express; an empty list means the contract is usable.
+
+    Only the final rule of the chain may be the LCTC. A clause window of a long
+    contract may leave contractName empty and its chain is relabelled when the
+    windows are merged, so neither is checked for window=True.
+    """
+    problems = []
+    if not window and not contract.contractName.strip():
+        problems.append("contractName is empty")
+    last = len(contract.penaltyRules) - 1
+    for i, rule in enumerate(contract.penaltyRules):
+        if not window and i == last and rule.deonticType != "LCTC":
+            problems.append(f"penaltyRules.{i}.deonticType must be 'LCTC' for the final rule")
+        elif not window and i < last and rule.deonticType == "LCTC":
+            problems.append(f"penaltyRules.{i}.deonticType must be 'Failing Which', only the final rule is 'LCTC'")
+        if not rule.action.triggerCond.strip():
+            problems.append(f"penaltyRules.{i}.action.triggerCond is empty")
+        if not rule.representor.strip():
+            problems.append(f"penaltyRules.{i}.representor is empty")
+    return problems
@@ -1,27 +1,158 @@
 import json
+import os
+import time
+import hashlib
 from pathlib import Path
 from deontic_gen_types import *
+from ast_rl import is_degraded
+from parse_memo import normalize_sentence
+from resilience import is_throttled
+
+def rule_key(rule):
+  """Content id of a rule in the streamed JSONL: normalized triggerCond, description and deonticType.
+
+  Rules can share a trigger condition and differ in their penalty, so the
+  trigger alone does not identify a rule; records also carry their index.
+  """
+  action = rule.get('action', {})
+  parts = (action.get('triggerCond'), action.get('description'), rule.get('deonticType'))
+  return hashlib.sha256("\x00".join(normalize_sentence(p or "") for p in parts).encode("utf-8")).hexdigest()[:16]
 
 class extractDeontic:
   def __init__(self, data: Contract, pipeline):
     self.data = data
     self.pipeline = pipeline
 
+  def _extract_rule(self, index, rule, raise_throttled=False):
+    triggerCond = rule.get('action', {}).get('triggerCond')
+    record = {
+      "key": rule_key(rule),
+      "index": index,
+      "rule": rule,
+      "ast": None,
+      "formula": None,
+      "degraded": False,
+      "error": None,
+    }
+    start_time = time.time()
+    try:
+      print(f'trying {triggerCond}')
+      deonticRule = self.pipeline.rephrase_and_parse(triggerCond)
+      print(deonticRule)
+      record["ast"] = deonticRule.to_dict()
+      record["formula"] = str(deonticRule)
+      record["degraded"] = is_degraded(deonticRule)
+      if record["degraded"]:
+        print("⚠️ Parse budget exhausted, part of this rule was kept as an opaque clause")
+    except Exception as e:
+      if raise_throttled and is_throttled(e):
+        raise  # not the rule's fault; the caller stops and resumes later
+      print(e)
+      record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.time() - start_time, 3)
+    return record
+
   def extract_deontic_from_data(self):
     deontic_output = ""
     rules = self.data['penaltyRules'] # array of rule
-    for rule in rules:
-      triggerCond = rule.get('action', {}).get('triggerCond')
-      try:
-        print(f'trying {triggerCond}')
-        deonticRule = self.pipeline.rephrase_and_parse(triggerCond)
-        deontic_output += str(deonticRule) + "\n"
-        print(deonticRule)
-      except Exception as e:
-        print(e)
-      
+    with self.pipeline.contract_scope():
+      for index, rule in enumerate(rules):
+        record = self._extract_rule(index, rule)
+        if record["error"] is None:
+          deontic_output += record["formula"] + "\n"
+
     return deontic_output
 
+  def output_path(self):
+    clean_name = self.data['contractName'].replace(' ', '_')
+    return Path("Extracted") / clean_name / f"{clean_name}.jsonl"
+
+  def completed_keys(self, outputfile=None):
+    """(index, key) of the rules already parsed successfully in the JSONL file"""
+    outputfile = Path(outputfile or self.output_path())
+    keys = set()
+    if not outputfile.exists():
+      return keys
+    with open(outputfile, "r", encoding="utf-8") as f:
+      for line in f:
+        try:
+          record = json.loads(line)
+        except json.JSONDecodeError:
+          continue  # partial last line of an interrupted run
+        if record.get("error") is None:
+          keys.add((record["index"], record["key"]))
+    return keys
+
+  def stream_deontic(self, outputfile=None, resume=True, raise_throttled=False):
+    """Yield one record per rule as soon as it is parsed, appending each to the contract's JSONL.
+
+    Records hold the rule, its to_dict() AST, the formula text and timing. With
+    resume, rules already parsed in the file are skipped, so an interrupted run
+    continues where it stopped. Failed rules are written with their error and
+    retried on the next run. With raise_throttled, a provider throttling error
+    is raised instead, leaving the rule unwritten for the resumed run.
+    """
+    outputfile = Path(outputfile or self.output_path())
+    outputfile.parent.mkdir(parents=True, exist_ok=True)
+    done = self.completed_keys(outputfile) if resume else set()
+    rules = self.data['penaltyRules'] # array of rule
+    with self.pipeline.contract_scope():
+      for index, rule in enumerate(rules):
+        key = (index, rule_key(rule))
+        if key in done:
+          continue
+        record = self._extract_rule(index, rule, raise_throttled)
+        with open(outputfile, "a", encoding="utf-8") as f:
+          f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if record["error"] is None:
+          done.add(key)
+        yield record
+
+  def update_deontic(self, outputfile=None):
+    """Bring the contract's JSONL up to date after the schema changed; returns the formula text.
+
+    Rules whose triggerCond already has a successful record are not parsed
+    again, only re-indexed; new or edited rules are parsed; records of rules no
+    longer in the contract are dropped. Rules sharing a triggerCond each take
+    one of its records, in order. The file is rewritten in rule order.
+    """
+    outputfile = Path(outputfile or self.output_path())
+    outputfile.parent.mkdir(parents=True, exist_ok=True)
+    previous = {}
+    if outputfile.exists():
+      with open(outputfile, "r", encoding="utf-8") as f:
+        for line in f:
+          try:
+            record = json.loads(line)
+          except json.JSONDecodeError:
+            continue
+          if record.get("error") is None:
+            trigger = normalize_sentence(record["rule"].get('action', {}).get('triggerCond') or "")
+            previous.setdefault(trigger, []).append(record)
+
+    records = []
+    parsed = 0
+    rules = self.data['penaltyRules'] # array of rule
+    with self.pipeline.contract_scope():
+      for index, rule in enumerate(rules):
+        # The formula only depends on the triggerCond
+        matches = previous.get(normalize_sentence(rule.get('action', {}).get('triggerCond') or ""))
+        if matches:
+          record = dict(matches.pop(0), key=rule_key(rule), index=index, rule=rule)
+        else:
+          record = self._extract_rule(index, rule)
+          parsed += 1
+        records.append(record)
+
+    tmpfile = outputfile.with_name(outputfile.name + ".tmp")
+    with open(tmpfile, "w", encoding="utf-8") as f:
+      for record in records:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmpfile, outputfile)
+    print(f"Parsed {parsed} of {len(records)} rules")
+
+    return "".join(r["formula"] + "\n" for r in records if r["error"] is None)
+
   def save_deontic_output(self, deontic_output):
     # save it to Extracted/{contractName}
     clean_name = self.data['contractName'].replace(' ', '_')
@@ -30,4 +161,4 @@ class extractDeontic:
     directory.mkdir(parents=True, exist_ok=True)
 
     with open(outputfile, "w", encoding="utf-8") as f:
-        f.write(str(deontic_output))
\ No newline at end of file
+        f.write(str(deontic_output))
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import argparse
+from pathlib import Path
+
+import compact_ast
+from compact_ast import Node, LAYOUT
+
+# File layout (little-endian), every section padded to 8 bytes:
+#   header         MAGIC, version, counts (HEADER)
+#   string_offsets uint64[n_strings + 1]   byte range of string i in string_data
+#   string_data    UTF-8 bytes
+#   node_kind      uint8[n_nodes]          index into KINDS
+#   attr_start     uint32[n_nodes + 1]     attrs of node i: attrs[attr_start[i]:attr_start[i + 1]]
+#   child_start    uint32[n_nodes + 1]     same for children
+#   attrs          uint32[n_attrs]         string ids
+#   children       uint32[n_children]      node ids, always lower than the parent's
+#   roots          uint32[n_roots]         node id of each stored formula
+# Equal subtrees are written once, so a corpus is stored as a DAG.
+MAGIC = b"DFRM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQQQQQ")
+KINDS = tuple(LAYOUT)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+
+def _pad(n):
+    return -n % 8
+
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _compact(tree):
+    """A compact_ast.Node from a Node, an ast_rl model or its to_dict() output"""
+    if isinstance(tree, Node):
+        return tree
+    if isinstance(tree, dict):
+        return compact_ast.from_dict(tree)
+    return compact_ast.from_model(tree)
+
+
+class FlatEncoder:
+    """Accumulates formulas into the flat arrays and writes them as one file"""
+
+    def __init__(self):
+        self._string_ids = {}
+        self._strings = []
+        self._node_ids = {}
+        self.node_kind = array.array("B")
+        self.attr_start = array.array("I", [0])
+        self.child_start = array.array("I", [0])
+        self.attrs = array.array("I")
+        self.children = array.array("I")
+        self.roots = array.array("I")
+
+    def _string(self, s):
+        sid = self._string_ids.get(s)
+        if sid is None:
+            sid = self._string_ids[s] = len(self._strings)
+            self._strings.append(s)
+        return sid
+
+    def _node(self, node):
+        nid = self._node_ids.get(node)
+        if nid is not None:
+            return nid
+        # Children first, so a reader can build every node from lower ids
+        child_ids = [self._node(c) for c in node.children]
+        nid = self._node_ids[node] = len(self.node_kind)
+        self.node_kind.append(KIND_CODES[node.kind])
+        self.attrs.extend(self._string(a) for a in node.attrs)
+        self.children.extend(child_ids)
+        self.attr_start.append(len(self.attrs))
+        self.child_start.append(len(self.children))
+        return nid
+
+    def add(self, tree):
+        """Append one formula; returns its index in the store"""
+        self.roots.append(self._node(_compact(tree)))
+        return len(self.roots) - 1
+
+    def __len__(self):
+        return len(self.roots)
+
+    def write(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = [s.encode("utf-8") for s in self._strings]
+        offsets = array.array("Q", [0])
+        for b in data:
+            offsets.append(offsets[-1] + len(b))
+        sections = [
+            _little_endian(offsets), b"".join(data), self.node_kind.tobytes(),
+            _little_endian(self.attr_start), _little_endian(self.child_start),
+            _little_endian(self.attrs), _little_endian(self.children), _little_endian(self.roots)
+        ]
+        tmpfile = path.with_name(path.name + ".tmp")
+        with open(tmpfile, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(self._strings), len(sections[1]), len(self.node_kind),
+                                len(self.attrs), len(self.children), len(self.roots)))
+            f.write(b"\0" * _pad(HEADER.size))
+            for section in sections:
+                f.write(section)
+                f.write(b"\0" * _pad(len(section)))
+        os.replace(tmpfile, path)
+
+
+def write_formulas(path, trees):
+    """Write formulas (compact nodes, ast_rl models or to_dict() dicts) to a flat store; returns the count"""
+    encoder = FlatEncoder()
+    for tree in trees:
+        encoder.add(tree)
+    encoder.write(path)
+    return len(encoder)
+
+
+class FormulaStore:
+    """Read-only, memory-mapped view of a file written by FlatEncoder.
+
+    The arrays are memoryviews over the mapping, nothing is copied on open.
+    store[i] decodes formula i into compact_ast nodes; nodes and strings shared
+    between formulas are decoded once.
+    """
+
+    def __init__(self, path, interner=None):
+        self.path = Path(path)
+        self.interner = interner or compact_ast.default_interner()
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, version, _, n_strings, string_bytes, n_nodes, n_attrs, n_children, n_roots = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"Not a formula store: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported formula store version {version}: {self.path}")
+
+        position = HEADER.size + _pad(HEADER.size)
+
+        def section(size, fmt=None):
+            nonlocal position
+            part = view[position:position + size]
+            position += size + _pad(size)
+            return part.cast(fmt) if fmt else part
+
+        self.string_offsets = section(8 * (n_strings + 1), "Q")
+        self.string_data = section(string_bytes)
+        self.node_kind = section(n_nodes, "B")
+        self.attr_start = section(4 * (n_nodes + 1), "I")
+        self.child_start = section(4 * (n_nodes + 1), "I")
+        self.attrs = section(4 * n_attrs, "I")
+        self.children = section(4 * n_children, "I")
+        self.roots = section(4 * n_roots, "I")
+        if sys.byteorder != "little":
+            # memoryviews are native-endian; only big-endian hosts pay for a copy
+            for name in ("string_offsets", "attr_start", "child_start", "attrs", "children", "roots"):
+                values = array.array(getattr(self, name).format, getattr(self, name))
+                values.byteswap()
+                setattr(self, name, values)
+        self._strings = {}
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self.roots)
+
+    def string(self, sid):
+        s = self._strings.get(sid)
+        if s is None:
+            s = self._strings[sid] = bytes(self.string_data[self.string_offsets[sid]:self.string_offsets[sid + 1]]).decode("utf-8")
+        return s
+
+    def kind(self, nid):
+        return KINDS[self.node_kind[nid]]
+
+    def node(self, nid):
+        node = self._nodes.get(nid)
+        if node is None:
+            attrs = tuple(self.string(s) for s in self.attrs[self.attr_start[nid]:self.attr_start[nid + 1]])
+            children = tuple(self.node(c) for c in self.children[self.child_start[nid]:self.child_start[nid + 1]])
+            node = self._nodes[nid] = self.interner.node(self.kind(nid), attrs, children)
+        return node
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.node(self.roots[i]) for i in range(*index.indices(len(self)))]
+        return self.node(self.roots[index])
+
+    def __iter__(self):
+        for nid in self.roots:
+            yield self.node(nid)
+
+    def close(self):
+        # Views over the mapping have to be released before it can be closed
+        for name in ("string_offsets", "string_data", "node_kind", "attr_start", "child_start", "attrs", "children", "roots"):
+            value = getattr(self, name)
+            if isinstance(value, memoryview):
+                value.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def dump_jsonl(trees, fp):
+    """Streaming JSON variant: one to_dict() tree per line"""
+    count = 0
+    for tree in trees:
+        fp.write(json.dumps(compact_ast.to_dict(_compact(tree)), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def load_jsonl(fp, interner=None):
+    """Yield compact trees from dump_jsonl output or from extractDeontic JSONL records (their "ast")"""
+    for line in fp:
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        if "node_type" not in data:
+            data = data.get("ast")
+            if data is None:
+                continue  # failed rule record
+        yield compact_ast.from_dict(data, interner)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the formulas of extractDeontic JSONL files into a flat store")
+    parser.add_argument("inputs", nargs="*", default=["Extracted"], help="JSONL files or directories")
+    parser.add_argument("-o", "--output", default="formulas.dfrm")
+    args = parser.parse_args()
+
+    def trees():
+        for name in args.inputs:
+            files = sorted(Path(name).rglob("*.jsonl")) if Path(name).is_dir() else [Path(name)]
+            for file in files:
+                with open(file, "r", encoding="utf-8") as f:
+                    yield from load_jsonl(f)
+
+    count = write_formulas(args.output, trees())
+    print(f"💾 Saved {count} formulas to: {args.output}")
@@ -1,12 +1,17 @@
+import re
 import json
 import os
+import difflib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import TypedDict, Optional
-from google import genai
-from google.genai import types
-from deontic_gen_types import Contract
-# Nhớ bảo mật API Key khi đưa lên GitHub hoặc submit paper nhé anh
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from pydantic import ValidationError
+from deontic_gen_types import Contract, ContractOutput, contract_problems
+from clients import get_gemini_client
+from structured_output import Prompt
+from parse_memo import normalize_sentence
+from schema_cache import SchemaCache, normalize_contract
+from resilience import is_throttled
 
 sys_instruction = """
 You are an expert Legal Process Engineer and Academic Researcher specialized in Deontic Logic and BPMN Choreography.
@@ -25,70 +30,352 @@ The target system maps these extracted rules into a BPMN Choreography. You MUST
 4. APPLY DEONTIC TYPES: Label every intermediate fallback step EXACTLY as "Failing Which". The absolute final step MUST EXACTLY be labeled "LCTC".
 5. HANDLE OPTIONS/NOTES: If an action has alternatives (e.g., "luxury interior OR king-size bed"), do not split them into different rules. Keep them in the "description" and summarize constraints in the "note" field.
 6. The triggerCond must be a standalone statement that is fully intelligible without reference to previous steps or external context. Replace all pronouns (e.g., "it," "they," "this") and relative descriptors (e.g., "such," "the aforementioned") with the specific nouns or parties they refer to.
-
-### REQUIRED OUTPUT SCHEMA:
-{
-  "contractName": "string",
-  "involvedParties": [ { "name": "string" } ],
-  "penaltyRules": [
-    {
-      "representor": "string (the party executing this action)",
-      "deonticType": "string (MUST be 'Failing Which' or 'LCTC')",
-      "action": {
-        "description": "string (A concise, high-level summary of the obligation or fallback action. Rephrase for clarity while maintaining intent.)",
-        "triggerCond": "string (The specific failure or condition of the PREVIOUS step that triggers this action. Must be self-contained, using specific nouns/parties instead of pronouns.)",
-        "note": "string (The verbatim or detailed technical constraints of the rule. Include specific values, timeframes, or 'OR' conditions.)"
-      }
-    }
-  ]
-}
 """
 
 
-def generate_schema(raw_text: str, save_to_file=True) -> Optional[Contract]:
+def generate_schema(raw_text: str, save_to_file=True, llm=None, cache=None) -> Optional[Contract]:
     """
     Generate structured JSON schema from contract text using Gemini AI.
     
     Args:
         raw_text (str): The contract text to parse
         save_to_file (bool): Whether to save the result to a JSON file (default: True)
+        llm: Optional pipeline wrapper (e.g. Pipeline(...).llm) to call instead of Gemini,
+             so the call is recorded/replayed together with the parse calls
+        cache: True or a SchemaCache; an unchanged contract text (up to whitespace)
+               is answered from the cache without calling the model
     
     Returns:
         dict: Parsed contract data with penalty rules, or None if parsing fails
     """
-    # Đã bật response_mime_type="application/json" để ép Gemini trả về JSON thuần
+    cache = SchemaCache() if cache is True else cache
+    if cache is not None:
+        data = cache.get(raw_text, sys_instruction)
+        if data is not None:
+            print("✅ Schema cache hit")
+            return _finish(data, save_to_file)
+
+    data = _extract(raw_text, llm)
+    if data is None:
+        return None
+    if cache is not None:
+        cache.put(raw_text, data, sys_instruction)
+    return _finish(data, save_to_file)
+
+
+def _validation_problems(error):
+    """One line per failed field of a pydantic ValidationError"""
+    return [f"{'.'.join(str(part) for part in e['loc']) or 'response'}: {e['msg']}" for e in error.errors()]
+
+
+def _repair_suffix(raw_text, problems, previous=None):
+    """Contract text plus what was wrong with the last answer, so the retry only fixes that"""
+    suffix = raw_text + "\n\n### YOUR PREVIOUS ANSWER WAS INVALID:\n" + "\n".join(f"- {p}" for p in problems)
+    if previous:
+        suffix += "\n\nPrevious answer:\n" + previous
+    return suffix + "\nReturn the complete corrected JSON, changing only what these errors require."
+
+
+def _request(suffix, raw_text, llm=None):
+    """One constrained-decoding call; the ContractOutput and the raw answer text (None through a wrapper)"""
+    if llm is not None:
+        prompt = Prompt(sys_instruction, suffix, raw_text)
+        prompt.template_name = "CONTRACT_SCHEMA_PROMPT"
+        return llm.generate(prompt, ContractOutput), None
+
+    from google.genai import types
+
+    # Reuses the pooled keep-alive client shared with the pipeline wrappers
+    client = get_gemini_client()
+    # response_schema lets Gemini decode straight into the Contract shape,
+    # so the schema no longer has to be spelled out in the prompt
     response = client.models.generate_content(
         model="gemini-2.5-flash",
-        contents=raw_text,
+        contents=suffix,
         config=types.GenerateContentConfig(
             system_instruction=sys_instruction,
             response_mime_type="application/json",
+            response_schema=ContractOutput,
             temperature=0.0  # Hạ xuống 0.0 để đảm bảo tính Deterministic (luôn ra kết quả nhất quán cho paper)
         )
     )
+    try:
+        return ContractOutput.model_validate_json(response.text or ""), response.text
+    except ValidationError as e:
+        e.raw_text = response.text
+        raise
+
+
+def _extract(raw_text, llm=None, max_repairs=2, window=False):
+    """One extraction with up to max_repairs targeted retries; the parsed contract dict or None.
+
+    A retry repeats the contract with the validation errors (and the invalid
+    answer when available) instead of starting the extraction from scratch.
+    """
+    suffix = raw_text
+    for attempt in range(max_repairs + 1):
+        try:
+            contract, previous = _request(suffix, raw_text, llm)
+            problems = contract_problems(contract, window)
+        except ValidationError as e:
+            previous = getattr(e, "raw_text", None)
+            problems = _validation_problems(e)
+        if not problems:
+            return contract.model_dump()
+        print(f"❌ Error: Invalid contract (attempt {attempt + 1} of {max_repairs + 1}): {'; '.join(problems)}")
+        suffix = _repair_suffix(raw_text, problems, previous)
+    return None
+
+
+# Windows mentioning none of these are skipped by the chunked extraction
+OBLIGATION_PATTERN = re.compile(
+    r"\b(shall|must|will|obligat\w*|requir\w*|fail\w*|breach\w*|default\w*|penalt\w*|liquidated|damages|"
+    r"refund\w*|compensat\w*|reimburs\w*|discount\w*|waiv\w*|credit\w*|terminat\w*|liab\w*|remed\w*|"
+    r"unless|in the event|failing which|otherwise|late|delay\w*)\b",
+    re.IGNORECASE
+)
+
+_segmenter = None
 
+
+def segment_sentences(raw_text):
+    """Sentence/clause segmentation with wtpsplit, or a regex splitter when it is not installed"""
+    global _segmenter
     try:
-        data= json.loads(response.text or "{}")
-        if data == {}:
-            print("❌ Error: Received empty JSON response")
-            print(response.text)
-            return None
-        print("✅ Extraction Success:")
-        dataJson = json.dumps(data, indent=2, ensure_ascii=False)
-        print(dataJson)
-        
-        if save_to_file:
-            clean_name = data['contractName'].replace(' ', "_")
-            directory = Path("Extracted") / clean_name
-            directory.mkdir(parents=True, exist_ok=True)
-            filename = directory / f"{clean_name}.json"
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(dataJson)
-            print(f"💾 Saved to: {filename}")
-        
-        return data
-
-    except json.JSONDecodeError:
-        print("❌ Error: Raw response is not valid JSON")
-        print(response.text)
+        from wtpsplit import SaT
+    except ImportError:
+        SaT = None
+    if SaT is not None:
+        if _segmenter is None:
+            _segmenter = SaT("sat-3l-sm")
+        return [s.strip() for s in _segmenter.split(raw_text) if s.strip()]
+    # Sentence ends, blank lines and numbered clause headings ("12.", "(b)") start a new segment
+    parts = re.split(r"(?<=[.;:!?])\s+(?=[A-Z(\d\[])|\n\s*\n|\n(?=\s*(?:\d+(?:\.\d+)*\.?|\([a-z0-9]+\))\s)", raw_text)
+    return [p.strip() for p in parts if p and p.strip()]
+
+
+def _window_spans(segments, max_chars, overlap, start=0, end=None):
+    """Greedy (start, end) segment spans of at most max_chars over segments[start:end]"""
+    end = len(segments) if end is None else end
+    spans = []
+    a, size = start, 0
+    for i in range(start, end):
+        if i > a and size + len(segments[i]) > max_chars:
+            spans.append((a, i))
+            a = max(a, i - overlap) if overlap else i
+            size = sum(len(s) + 1 for s in segments[a:i])
+        size += len(segments[i]) + 1
+    # Unless only the overlap of the last window is left
+    if a < end and (not spans or spans[-1][1] < end):
+        spans.append((a, end))
+    return spans
+
+
+def clause_windows(raw_text, max_chars=6000, overlap=1):
+    """Group consecutive segments into windows of at most max_chars.
+
+    Each window repeats the last `overlap` segments of the previous one so a
+    rule split across a boundary is seen whole at least once.
+    Returns [{"index", "text"}] in document order.
+    """
+    segments = segment_sentences(raw_text)
+    return [{"index": i, "text": " ".join(segments[a:b])} for i, (a, b) in enumerate(_window_spans(segments, max_chars, overlap))]
+
+
+def plan_windows(segments, previous_segments, previous_spans, max_chars=6000, overlap=1):
+    """Window spans over segments that keep every previous window whose clauses are unchanged.
+
+    The segment lists are diffed; a previous window survives when all of its
+    segments are matched, in one piece, in the new text. The changed runs in
+    between get fresh windows, widened by `overlap` segments on both sides so a
+    rule crossing the edit is seen whole.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [normalize_contract(s) for s in previous_segments], [normalize_contract(s) for s in segments], autojunk=False
+    )
+    moved = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                moved[i1 + k] = j1 + k
+
+    spans = []
+    covered = [False] * len(segments)
+    for a, b in previous_spans:
+        if all(i in moved for i in range(a, b)) and moved[b - 1] - moved[a] == b - 1 - a:
+            spans.append((moved[a], moved[b - 1] + 1))
+            covered[moved[a]:moved[b - 1] + 1] = [True] * (b - a)
+
+    i = 0
+    while i < len(segments):
+        if covered[i]:
+            i += 1
+            continue
+        j = i
+        while j < len(segments) and not covered[j]:
+            j += 1
+        spans += _window_spans(segments, max_chars, overlap, max(0, i - overlap), min(len(segments), j + overlap))
+        i = j
+    return sorted(set(spans))
+
+
+def _rule_key(rule):
+    action = rule.get("action", {})
+    return (normalize_sentence(action.get("triggerCond", "")), normalize_sentence(action.get("description", "")))
+
+
+def merge_contracts(partials):
+    """Merge per-window contracts (in document order) into one Contract with a single LCTC"""
+    names = [p.get("contractName") for p in partials if p.get("contractName")]
+    parties, seen_parties = [], set()
+    rules, seen_rules = [], set()
+    for partial in partials:
+        for party in partial.get("involvedParties", []):
+            key = normalize_sentence(party.get("name", ""))
+            if key and key not in seen_parties:
+                seen_parties.add(key)
+                parties.append(party)
+        for rule in partial.get("penaltyRules", []):
+            # Overlapping windows can extract the same rule twice
+            key = _rule_key(rule)
+            if key not in seen_rules:
+                seen_rules.add(key)
+                rules.append(rule)
+    return {
+        # The first window usually holds the title
+        "contractName": names[0] if names else "Contract",
+        "involvedParties": parties,
+        "penaltyRules": relabel_chain(rules)
+    }
+
+
+def relabel_chain(rules):
+    """The fallback chain with only its final rule labelled LCTC.
+
+    Every window ends its own partial chain with an LCTC; once the windows are
+    concatenated those are intermediate steps and become "Failing Which".
+    """
+    return [
+        dict(rule, deonticType="LCTC" if i == len(rules) - 1 else "Failing Which")
+        for i, rule in enumerate(rules)
+    ]
+
+
+def generate_schema_chunked(raw_text: str, save_to_file=True, llm=None, max_chars=6000, overlap=1, max_workers=8,
+                            raise_throttled=False) -> Optional[Contract]:
+    """
+    Extract a long contract window by window, with the windows in flight concurrently.
+
+    The contract is segmented into clause windows of at most max_chars; windows
+    without obligation/penalty wording are skipped. Partial contracts are merged
+    in document order (parties de-duplicated, repeated rules dropped).
+    A failed window is skipped, unless raise_throttled is set and the provider
+    throttled it; then the error is raised so the caller can stop and retry later.
+    """
+    windows = [w for w in clause_windows(raw_text, max_chars, overlap) if OBLIGATION_PATTERN.search(w["text"])]
+    if not windows:
+        print("❌ Error: No clause window mentions an obligation or penalty")
         return None
+    print(f"Extracting {len(windows)} clause windows")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_extract, w["text"], llm, window=True) for w in windows]
+        partials = []
+        for window, future in zip(windows, futures):
+            try:
+                data = future.result()
+            except Exception as e:
+                if raise_throttled and is_throttled(e):
+                    raise
+                print(f"❌ Error: window {window['index']} failed: {e}")
+                continue
+            if data is not None:
+                partials.append(data)
+    if not partials:
+        return None
+    return _finish(merge_contracts(partials), save_to_file)
+
+
+def generate_schema_incremental(raw_text: str, cache=True, document=None, save_to_file=True, llm=None,
+                                max_chars=6000, overlap=1, max_workers=8) -> Optional[Contract]:
+    """
+    Windowed extraction that only re-extracts the clauses changed since the last version.
+
+    An unchanged contract is answered from the cache. Otherwise the text is
+    diffed clause by clause against the last version of the same `document`
+    (e.g. its file name), the windows whose clauses are unchanged reuse their
+    cached partial contracts, and only the changed windows are sent to the
+    model. The partials are merged in document order, which splices the new
+    penaltyRules in place of the old ones; the contract keeps its previous
+    name so downstream outputs stay at the same path. Without a cache
+    (None/False) every window is extracted, as in generate_schema_chunked.
+    """
+    if not cache:
+        return generate_schema_chunked(raw_text, save_to_file, llm, max_chars, overlap, max_workers)
+    cache = SchemaCache() if cache is True else cache
+    data = cache.get(raw_text, sys_instruction)
+    if data is not None:
+        print("✅ Schema cache hit")
+        return _finish(data, save_to_file)
+
+    segments = segment_sentences(raw_text)
+    previous = cache.latest(document) if document is not None else None
+    if previous is not None:
+        spans = plan_windows(segments, previous["segments"], previous["spans"], max_chars, overlap)
+    else:
+        spans = _window_spans(segments, max_chars, overlap)
+
+    windows = [" ".join(segments[a:b]) for a, b in spans]
+    partials = [None] * len(windows)
+    todo = []
+    for k, text in enumerate(windows):
+        if not OBLIGATION_PATTERN.search(text):
+            continue
+        partials[k] = cache.get_window(text, sys_instruction)
+        if partials[k] is None:
+            todo.append(k)
+    print(f"Extracting {len(todo)} of {len(windows)} clause windows")
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {k: executor.submit(_extract, windows[k], llm, window=True) for k in todo}
+        for k, future in futures.items():
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"❌ Error: window {k} failed: {e}")
+                data = None
+            if data is None:
+                failed = True
+                continue
+            partials[k] = data
+            cache.put_window(windows[k], data, sys_instruction)
+
+    partials = [p for p in partials if p is not None]
+    if not partials:
+        print("❌ Error: No clause window could be extracted")
+        return None
+    data = merge_contracts(partials)
+    if previous is not None:
+        data["contractName"] = previous["contract"]["contractName"]
+    # A version with failed windows is not stored, so the next run retries them
+    if not failed:
+        cache.put(raw_text, data, sys_instruction, segments, spans, document)
+    return _finish(data, save_to_file)
+
+
+def _finish(data, save_to_file):
+    print("✅ Extraction Success:")
+    dataJson = json.dumps(data, indent=2, ensure_ascii=False)
+    print(dataJson)
+    
+    if save_to_file:
+        clean_name = data['contractName'].replace(' ', "_")
+        directory = Path("Extracted") / clean_name
+        directory.mkdir(parents=True, exist_ok=True)
+        filename = directory / f"{clean_name}.json"
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(dataJson)
+        print(f"💾 Saved to: {filename}")
+    
+    return data
@@ -0,0 +1,75 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# Cold import budget per module in milliseconds. Most of it is pydantic building
+# the ast_rl / structured_output models; backend SDKs must not be in it.
+BUDGETS = {
+    "pipeline": 250,
+    "generate_schema": 250,
+    "extractDeontic": 250,
+    "batch": 250,
+}
+
+# Modules that are only imported once the corresponding llm= backend is used
+BACKEND_MODULES = ("google.genai", "openai", "ollama", "httpx", "wtpsplit", "torch", "sklearn")
+
+
+def import_time(module, repeat=3):
+    """Best cold import time of a module in ms (python -X importtime, fresh interpreter each run)"""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True
+        )
+        for line in result.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                ms = int(parts[1]) / 1000
+                best = ms if best is None else min(best, ms)
+    return best
+
+
+def loaded_backends(module):
+    """Backend SDK modules present in sys.modules after importing a module"""
+    code = (
+        f"import sys, json, {module}\n"
+        f"print(json.dumps([m for m in {BACKEND_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check(budgets=BUDGETS, repeat=3):
+    """One row per module: import time, budget, leaked backend modules, ok"""
+    rows = []
+    for module, budget in budgets.items():
+        ms = import_time(module, repeat)
+        leaked = loaded_backends(module)
+        rows.append({
+            "module": module,
+            "ms": ms,
+            "budget": budget,
+            "leaked": leaked,
+            "ok": ms is not None and ms <= budget and not leaked
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check cold import times against the budget")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS), help="Modules to check")
+    parser.add_argument("--budget", type=float, default=None, help="Override the budget (ms) for every module")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module, the best one counts")
+    args = parser.parse_args()
+
+    budgets = {m: args.budget or BUDGETS.get(m, 250) for m in args.modules}
+    rows = check(budgets, args.repeat)
+    for row in rows:
+        status = "✅" if row["ok"] else "❌"
+        leaked = f"  loads {', '.join(row['leaked'])}" if row["leaked"] else ""
+        print(f"{status} {row['module']:<18}{row['ms']:>8.1f} ms  (budget {row['budget']} ms){leaked}")
+    sys.exit(0 if all(row["ok"] for row in rows) else 1)
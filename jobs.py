@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from generate_schema import generate_schema, generate_schema_chunked
+from extractDeontic import extractDeontic
+from resilience import is_throttled
+
+STAGES = ("schema", "deontic")
+
+# Pipeline of the current worker: set once per process by _init_worker,
+# or directly when a thread pool shares an existing Pipeline
+_pipeline = None
+
+
+def _init_worker(pipeline_options):
+    global _pipeline
+    from pipeline import Pipeline
+    _pipeline = Pipeline(**pipeline_options)
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _job_id(path, root):
+    """Output name of a contract: its path below root without suffix, '/' replaced by '__'"""
+    try:
+        relative = Path(path).relative_to(root)
+    except ValueError:
+        relative = Path(Path(path).name)
+    return "__".join(relative.with_suffix("").parts).replace(" ", "_")
+
+
+def load_jobs(source, pattern="*.txt"):
+    """[{"id", "path"}] of the contracts in a directory, a manifest or a single contract file.
+
+    A directory is searched recursively for `pattern`. A .json manifest holds a
+    list and a .jsonl manifest one entry per line; entries are paths or
+    {"path", "id"} objects, with relative paths resolved against the manifest.
+    """
+    source = Path(source)
+    if source.is_dir():
+        return [{"id": _job_id(p, source), "path": str(p)} for p in sorted(source.rglob(pattern))]
+
+    if source.suffix == ".json":
+        with open(source, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    elif source.suffix == ".jsonl":
+        with open(source, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    else:
+        return [{"id": _job_id(source, source.parent), "path": str(source)}]
+
+    jobs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        path = Path(entry["path"])
+        if not path.is_absolute():
+            path = source.parent / path
+        jobs.append({"id": entry.get("id") or _job_id(path, source.parent), "path": str(path)})
+    return jobs
+
+
+class Checkpoint:
+    """Manifest of the finished stages of every contract, rewritten atomically after each stage.
+
+    A contract whose text changed since it was recorded (by sha256) starts over.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"version": 1, "jobs": {}}
+
+    def job(self, job_id, path, text_hash):
+        entry = self.data["jobs"].get(job_id)
+        if entry is None or entry.get("sha256") != text_hash:
+            entry = {"path": path, "sha256": text_hash, "stages": {}, "attempts": 0, "error": None}
+            self.data["jobs"][job_id] = entry
+        return entry
+
+    def done(self, job_id, stage):
+        entry = self.data["jobs"].get(job_id)
+        return bool(entry and entry["stages"].get(stage, {}).get("done"))
+
+    def save(self):
+        tmpfile = self.path.with_name(self.path.name + ".tmp")
+        with open(tmpfile, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmpfile, self.path)
+
+
+def _run_stage(stage, job, options):
+    """One stage of one contract in a worker; exceptions are returned, not raised, so they cross process pools"""
+    start_time = time.time()
+    result = {"id": job["id"], "stage": stage, "error": None, "throttled": False}
+    try:
+        directory = Path(options["output_dir"]) / job["id"]
+        directory.mkdir(parents=True, exist_ok=True)
+        schema_file = directory / f"{job['id']}.json"
+        if stage == "schema":
+            with open(job["path"], "r", encoding="utf-8") as f:
+                text = f.read()
+            llm = _pipeline.llm if options["schema_via_pipeline"] else None
+            if options["chunk_chars"] and len(text) > options["chunk_chars"]:
+                schema = generate_schema_chunked(text, save_to_file=False, llm=llm, max_chars=options["chunk_chars"],
+                                                 raise_throttled=True)
+            else:
+                schema = generate_schema(text, save_to_file=False, llm=llm, cache=options["schema_cache"])
+            if schema is None:
+                raise ValueError("schema extraction returned no contract")
+            with open(schema_file, "w", encoding="utf-8") as f:
+                json.dump(schema, f, indent=2, ensure_ascii=False)
+            result["rules"] = len(schema.get("penaltyRules", []))
+        else:
+            with open(schema_file, "r", encoding="utf-8") as f:
+                schema = json.load(f)
+            extractor = extractDeontic(schema, _pipeline)
+            records = list(extractor.stream_deontic(directory / f"{job['id']}.jsonl", raise_throttled=True))
+            result["rules"] = len(records)
+            result["failed_rules"] = sum(r["error"] is not None for r in records)
+            result["degraded_rules"] = sum(bool(r["degraded"]) for r in records)
+            if result["failed_rules"]:
+                result["error"] = f"{result['failed_rules']} of {len(records)} rules failed"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["throttled"] = is_throttled(e)
+    result["seconds"] = round(time.time() - start_time, 3)
+    return result
+
+
+class JobRunner:
+    """Runs generate_schema then extractDeontic over many contracts with bounded concurrency.
+
+    Every finished stage is recorded in the checkpoint manifest, so a rerun
+    skips completed contracts and stages; a contract interrupted inside the
+    deontic stage continues from its JSONL (see extractDeontic.stream_deontic).
+    A provider throttling error that survived the retries stops the run:
+    nothing new is started and the unfinished contracts stay pending.
+
+    `pipeline` is a Pipeline shared by the worker threads or a dict of
+    Pipeline(...) arguments; processes=True requires the dict and builds one
+    pipeline per worker process.
+    """
+
+    def __init__(self, pipeline, checkpoint=".jobs/checkpoint.json", output_dir="Extracted", max_workers=4,
+                 processes=False, schema_via_pipeline=False, schema_cache=None, chunk_chars=None,
+                 max_attempts=3, stop_on_throttle=True):
+        if processes and not isinstance(pipeline, dict):
+            raise ValueError("A process pool needs the Pipeline arguments as a dict")
+        self.pipeline = pipeline
+        self.checkpoint = Checkpoint(checkpoint)
+        self.max_workers = max_workers
+        self.processes = processes
+        # Contracts whose stage failed this many times are not retried on resume
+        self.max_attempts = max_attempts
+        self.stop_on_throttle = stop_on_throttle
+        self.options = {
+            "output_dir": str(output_dir),
+            "schema_via_pipeline": schema_via_pipeline,
+            "schema_cache": schema_cache,
+            "chunk_chars": chunk_chars,
+        }
+
+    def _executor(self):
+        global _pipeline
+        if self.processes:
+            return ProcessPoolExecutor(self.max_workers, initializer=_init_worker, initargs=(self.pipeline,))
+        if isinstance(self.pipeline, dict):
+            _init_worker(self.pipeline)
+        else:
+            _pipeline = self.pipeline
+        return ThreadPoolExecutor(self.max_workers)
+
+    def _next_stage(self, job):
+        for stage in STAGES:
+            if not self.checkpoint.done(job["id"], stage):
+                return stage
+        return None
+
+    def run(self, jobs):
+        """Process the jobs from load_jobs(); returns the run report"""
+        start_time = time.time()
+        report = {"contracts": len(jobs), "completed": 0, "skipped": 0, "failed": [], "pending": 0,
+                  "stages": {stage: 0 for stage in STAGES}, "rules": 0, "failed_rules": 0, "degraded_rules": 0,
+                  "throttled": False}
+
+        queue = []
+        for job in jobs:
+            try:
+                with open(job["path"], "r", encoding="utf-8") as f:
+                    text_hash = _text_hash(f.read())
+            except OSError as e:
+                report["failed"].append({"id": job["id"], "stage": "read", "error": str(e)})
+                continue
+            entry = self.checkpoint.job(job["id"], job["path"], text_hash)
+            if self._next_stage(job) is None:
+                report["skipped"] += 1
+            elif entry["attempts"] >= self.max_attempts:
+                report["failed"].append({"id": job["id"], "stage": self._next_stage(job), "error": entry["error"]})
+            else:
+                queue.append(job)
+        self.checkpoint.save()
+        print(f"{len(queue)} of {len(jobs)} contracts to process ({report['skipped']} already done)")
+
+        by_id = {job["id"]: job for job in queue}
+        queue.reverse()  # pop() takes them in manifest order
+        ready = []  # contracts whose schema is done, run before starting new ones
+        running = set()
+        stopping = False
+        with self._executor() as executor:
+            while running or (not stopping and (queue or ready)):
+                while not stopping and len(running) < self.max_workers and (queue or ready):
+                    job = ready.pop() if ready else queue.pop()
+                    running.add(executor.submit(_run_stage, self._next_stage(job), job, self.options))
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    job = by_id[result["id"]]
+                    entry = self.checkpoint.data["jobs"][job["id"]]
+                    report["stages"][result["stage"]] += 1
+                    if result["stage"] == "deontic":
+                        report["rules"] += result.get("rules", 0)
+                        report["failed_rules"] += result.get("failed_rules", 0)
+                        report["degraded_rules"] += result.get("degraded_rules", 0)
+
+                    if result["error"] is None:
+                        entry["stages"][result["stage"]] = {
+                            "done": True,
+                            "seconds": result["seconds"],
+                            "rules": result.get("rules", 0),
+                            "finished_at": datetime.datetime.now().isoformat(timespec="seconds")
+                        }
+                        entry["attempts"] = 0
+                        entry["error"] = None
+                        if self._next_stage(job) is None:
+                            report["completed"] += 1
+                        else:
+                            ready.append(job)
+                    elif result["throttled"] and self.stop_on_throttle:
+                        # Not the contract's fault: leave it pending for the next run
+                        print(f"❌ Throttled by the provider, stopping: {result['error']}")
+                        report["throttled"] = True
+                        stopping = True
+                        queue.append(job)
+                    else:
+                        print(f"❌ Error: {job['id']} {result['stage']} failed: {result['error']}")
+                        entry["attempts"] += 1
+                        entry["error"] = result["error"]
+                        report["failed"].append({"id": job["id"], "stage": result["stage"], "error": result["error"]})
+                    self.checkpoint.save()
+
+        report["pending"] = len(queue) + len(ready)
+        report["wall_seconds"] = round(time.time() - start_time, 3)
+        processed = report["completed"] + len(report["failed"])
+        report["contracts_per_second"] = processed / report["wall_seconds"] if report["wall_seconds"] else 0.0
+        report["rules_per_second"] = report["rules"] / report["wall_seconds"] if report["wall_seconds"] else 0.0
+        return report
+
+
+def summary(report):
+    lines = [
+        f"contracts: {report['contracts']}  completed: {report['completed']}  skipped: {report['skipped']}  "
+        f"failed: {len(report['failed'])}  pending: {report['pending']}",
+        "stages run: " + "  ".join(f"{stage}={n}" for stage, n in report["stages"].items()),
+        f"rules: {report['rules']}  failed: {report['failed_rules']}  degraded: {report['degraded_rules']}",
+        f"wall: {report['wall_seconds']:.1f}s  {report['contracts_per_second']:.3f} contracts/s  "
+        f"{report['rules_per_second']:.2f} rules/s",
+    ]
+    if report["throttled"]:
+        lines.append("stopped early: provider throttling, rerun to resume")
+    for failure in report["failed"]:
+        lines.append(f"  ❌ {failure['id']} ({failure['stage']}): {failure['error']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run schema and deontic extraction over many contracts, resumably")
+    parser.add_argument("source", help="Directory of contracts, .json/.jsonl manifest or a contract file")
+    parser.add_argument("--pattern", default="*.txt", help="Contract files to pick up in a directory")
+    parser.add_argument("--llm", default="gemini", help="Pipeline backend: gemini, openai, ollama, vllm")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--strategy", default="cascade")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="Contract stages in flight")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    parser.add_argument("--checkpoint", default=".jobs/checkpoint.json")
+    parser.add_argument("-o", "--output-dir", default="Extracted")
+    parser.add_argument("--schema-via-pipeline", action="store_true", help="Extract schemas with the pipeline's backend")
+    parser.add_argument("--schema-cache", action="store_true", help="Reuse schemas of unchanged contracts")
+    parser.add_argument("--chunk-chars", type=int, default=None, help="Extract longer contracts window by window")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="Serve repeated LLM calls from the response cache")
+    args = parser.parse_args()
+
+    runner = JobRunner(
+        {"llm": args.llm, "model": args.model, "strategy": args.strategy, "cache": args.cache},
+        checkpoint=args.checkpoint, output_dir=args.output_dir, max_workers=args.workers, processes=args.processes,
+        schema_via_pipeline=args.schema_via_pipeline, schema_cache=args.schema_cache or None,
+        chunk_chars=args.chunk_chars, max_attempts=args.max_attempts
+    )
+    report = runner.run(load_jobs(args.source, args.pattern))
+    print(summary(report))
+    output = Path(args.checkpoint).with_name(f"run_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 Saved to: {output}")
@@ -0,0 +1,171 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class LLMCache:
+    """Persistent content-addressed store of validated LLM responses.
+
+    Entries are keyed on (wrapper, model, prompt text, response schema) and
+    hold the JSON dump of the pydantic response, so a hit is re-validated into
+    the same type the wrapper would have returned.
+    """
+
+    def __init__(self, path=None, max_entries=100_000, max_age=None, evict_every=100):
+        if path is None:
+            cache_dir = Path(".cache")
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            path = cache_dir / "llm_cache.sqlite"
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age  # seconds, None = never expire
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+
+        self._schemas = {}
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    schema_name TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+            self._conn.commit()
+        self.evict()
+
+    def _schema_text(self, fmt):
+        """Canonical JSON schema of a response type, computed once per type"""
+        schema = self._schemas.get(fmt)
+        if schema is None:
+            schema = json.dumps(fmt.model_json_schema(), sort_keys=True)
+            self._schemas[fmt] = schema
+        return schema
+
+    def make_key(self, wrapper_name, model, text, fmt):
+        h = hashlib.sha256()
+        for part in (wrapper_name, model, text, self._schema_text(fmt)):
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def get(self, key, fmt):
+        """Return the cached response validated as `fmt`, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        try:
+            response = fmt.model_validate_json(row[0])
+        except Exception:
+            # Schema drifted since the entry was written; treat it as a miss
+            with self._lock:
+                self.misses += 1
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+            return None
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def put(self, key, fmt, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, schema_name, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, getattr(fmt, "__name__", str(fmt)), response.model_dump_json(), now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        with self._lock:
+            if self.max_age is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                excess = count - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                        (excess,)
+                    )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedLLM:
+    """Wrapper that answers repeated generate calls from an LLMCache"""
+
+    def __init__(self, llm_wrapper, cache, wrapper_name="LLMWrapper", model=""):
+        self.wrapper = llm_wrapper
+        self.cache = cache
+        self.wrapper_name = wrapper_name
+        self.model = model
+
+    def generate(self, text, fmt):
+        key = self.cache.make_key(self.wrapper_name, self.model, text, fmt)
+        response = self.cache.get(key, fmt)
+        if response is not None:
+            return response
+
+        response = self.wrapper.generate(text, fmt)
+        self.cache.put(key, fmt, response)
+        return response
+
+    async def agenerate(self, text, fmt):
+        key = self.cache.make_key(self.wrapper_name, self.model, text, fmt)
+        response = self.cache.get(key, fmt)
+        if response is not None:
+            return response
+
+        response = await self.wrapper.agenerate(text, fmt)
+        self.cache.put(key, fmt, response)
+        return response
@@ -0,0 +1,208 @@
+import re
+import zlib
+import random
+import argparse
+from pathlib import Path
+
+from api_logger import read_log
+
+# Templates whose answer can be predicted locally, with their response type name.
+# Both response types are a single `answer` letter.
+CLASSIFIABLE_TEMPLATES = {
+    'CHOOSE_PARSER_SYSTEM_PROMPT': ("ChooseParser", ["A", "B", "C", "D"]),
+    'CHOOSE_RELATION_SYSTEM_PROMPT': ("ChooseRelation", ["A", "B", "C", "D"]),
+}
+
+def featurize(sentence, buckets):
+    """Hashed word unigrams, bigrams and character trigrams with their counts"""
+    words = re.findall(r"[a-z0-9']+|[^\sa-z0-9']", sentence.lower())
+    features = ["w:" + w for w in words]
+    features += ["b:" + a + "_" + b for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"^{w}$"
+        features += ["c:" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    counts = {}
+    for f in features:
+        index = zlib.crc32(f.encode("utf-8")) % buckets
+        counts[index] = counts.get(index, 0) + 1
+    norm = sum(c * c for c in counts.values()) ** 0.5 or 1.0
+    return list(counts.keys()), [c / norm for c in counts.values()]
+
+
+def load_examples_from_logs(paths):
+    """Collect (sentence, answer) pairs per template from APILogger files or directories"""
+    examples = {name: [] for name in CLASSIFIABLE_TEMPLATES}
+    for call, outcome in read_log(paths):
+        if call.get("template") not in examples or not call.get("sentence"):
+            continue
+        if outcome is None or outcome.get("event") != "response":
+            continue
+        answer = outcome["response"].get("answer") if isinstance(outcome["response"], dict) else None
+        if answer in CLASSIFIABLE_TEMPLATES[call["template"]][1]:
+            examples[call["template"]].append((call["sentence"], answer))
+    return examples
+
+
+def _require_torch():
+    try:
+        import torch
+    except ImportError as e:
+        raise ImportError("The local classifier needs torch (pip install torch)") from e
+    return torch
+
+
+class LocalClassifier:
+    """Small CPU text classifiers (one head per template) distilled from logged LLM answers"""
+
+    def __init__(self, buckets=2 ** 18, hidden=64):
+        self.buckets = buckets
+        self.hidden = hidden
+        self.heads = {}  # template name -> (labels, model)
+
+    def _model(self, n_labels):
+        torch = _require_torch()
+        return torch.nn.ModuleDict({
+            "embed": torch.nn.EmbeddingBag(self.buckets, self.hidden, mode="sum"),
+            "out": torch.nn.Linear(self.hidden, n_labels)
+        })
+
+    def _forward(self, model, batch):
+        torch = _require_torch()
+        indices, weights, offsets = [], [], []
+        for sentence in batch:
+            i, w = featurize(sentence, self.buckets)
+            offsets.append(len(indices))
+            indices += i
+            weights += w
+        hidden = model["embed"](
+            torch.tensor(indices, dtype=torch.long),
+            torch.tensor(offsets, dtype=torch.long),
+            per_sample_weights=torch.tensor(weights, dtype=torch.float32)
+        )
+        return model["out"](torch.relu(hidden))
+
+    def fit(self, examples, epochs=20, batch_size=64, lr=0.01, holdout=0.1, seed=0):
+        """Train one head per template; returns held-out accuracy per template"""
+        torch = _require_torch()
+        torch.manual_seed(seed)
+        rng = random.Random(seed)
+        report = {}
+        for name, pairs in examples.items():
+            if name not in CLASSIFIABLE_TEMPLATES or len(pairs) < 2:
+                continue
+            labels = CLASSIFIABLE_TEMPLATES[name][1]
+            pairs = [(s, labels.index(a)) for s, a in pairs if a in labels]
+            rng.shuffle(pairs)
+            n_test = int(len(pairs) * holdout)
+            test, train = pairs[:n_test], pairs[n_test:]
+
+            model = self._model(len(labels))
+            optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+            for _ in range(epochs):
+                rng.shuffle(train)
+                for start in range(0, len(train), batch_size):
+                    batch = train[start:start + batch_size]
+                    logits = self._forward(model, [s for s, _ in batch])
+                    loss = torch.nn.functional.cross_entropy(logits, torch.tensor([y for _, y in batch]))
+                    optimizer.zero_grad()
+                    loss.backward()
+                    optimizer.step()
+            model.eval()
+            self.heads[name] = (labels, model)
+
+            if test:
+                with torch.no_grad():
+                    predicted = self._forward(model, [s for s, _ in test]).argmax(dim=1).tolist()
+                report[name] = sum(p == y for p, (_, y) in zip(predicted, test)) / len(test)
+        return report
+
+    def predict(self, template_name, sentence):
+        """(answer, confidence) for a template with a trained head, else None"""
+        head = self.heads.get(template_name)
+        if head is None:
+            return None
+        torch = _require_torch()
+        labels, model = head
+        with torch.no_grad():
+            probs = torch.softmax(self._forward(model, [sentence])[0], dim=0)
+        confidence, index = probs.max(dim=0)
+        return labels[int(index)], float(confidence)
+
+    def save(self, path):
+        torch = _require_torch()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        torch.save({
+            "buckets": self.buckets,
+            "hidden": self.hidden,
+            "heads": {name: {"labels": labels, "state_dict": model.state_dict()} for name, (labels, model) in self.heads.items()}
+        }, str(path))
+
+    @classmethod
+    def load(cls, path):
+        torch = _require_torch()
+        data = torch.load(str(path), map_location="cpu")
+        classifier = cls(data["buckets"], data["hidden"])
+        for name, head in data["heads"].items():
+            model = classifier._model(len(head["labels"]))
+            model.load_state_dict(head["state_dict"])
+            model.eval()
+            classifier.heads[name] = (head["labels"], model)
+        return classifier
+
+
+class LocalClassifierLLM:
+    """Answers ChooseParser/ChooseRelation prompts locally when the classifier is confident"""
+
+    def __init__(self, llm_wrapper, classifier, threshold=0.9):
+        self.wrapper = llm_wrapper
+        self.classifier = classifier
+        self.threshold = threshold
+        self.local_answers = 0
+        self.fallbacks = 0
+
+    def _local(self, text, fmt):
+        template_name = getattr(text, "template_name", "")
+        sentence = getattr(text, "sentence", None)
+        if sentence is None or template_name not in CLASSIFIABLE_TEMPLATES:
+            return None
+        if fmt.__name__ != CLASSIFIABLE_TEMPLATES[template_name][0]:
+            return None
+        prediction = self.classifier.predict(template_name, sentence)
+        if prediction is None or prediction[1] < self.threshold:
+            self.fallbacks += 1
+            return None
+        self.local_answers += 1
+        return fmt(answer=prediction[0])
+
+    def generate(self, text, fmt):
+        response = self._local(text, fmt)
+        return response if response is not None else self.wrapper.generate(text, fmt)
+
+    async def agenerate(self, text, fmt):
+        response = self._local(text, fmt)
+        return response if response is not None else await self.wrapper.agenerate(text, fmt)
+
+    def stats(self):
+        total = self.local_answers + self.fallbacks
+        return {
+            "local_answers": self.local_answers,
+            "fallbacks": self.fallbacks,
+            "local_rate": self.local_answers / total if total else 0.0
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the local ChooseParser/ChooseRelation classifier from API logs")
+    parser.add_argument("logs", nargs="*", default=[".log"], help="APILogger files or directories")
+    parser.add_argument("-o", "--output", default=".cache/local_classifier.pt")
+    parser.add_argument("--epochs", type=int, default=20)
+    args = parser.parse_args()
+
+    examples = load_examples_from_logs(args.logs)
+    for name, pairs in examples.items():
+        print(f"{name}: {len(pairs)} examples")
+    classifier = LocalClassifier()
+    for name, accuracy in classifier.fit(examples, epochs=args.epochs).items():
+        print(f"{name}: held-out accuracy {accuracy:.3f}")
+    classifier.save(args.output)
+    print(f"💾 Saved to: {args.output}")
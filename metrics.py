@@ -0,0 +1,224 @@
+import json
+import time
+import bisect
+import threading
+import contextvars
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+# Token usage of the provider call currently in flight. MetricsInterceptor
+# installs a dict here and the wrappers fill it through report_usage().
+_current_usage = contextvars.ContextVar("current_usage", default=None)
+
+
+def report_usage(input_tokens=None, output_tokens=None, cached_tokens=None):
+    """Called by wrappers with the token counts the provider reported"""
+    usage = _current_usage.get()
+    if usage is None:
+        return
+    usage["input_tokens"] = input_tokens or 0
+    usage["output_tokens"] = output_tokens or 0
+    usage["cached_tokens"] = cached_tokens or 0
+
+
+def _is_validation_error(error):
+    try:
+        from pydantic import ValidationError
+    except ImportError:
+        return isinstance(error, json.JSONDecodeError)
+    return isinstance(error, (ValidationError, json.JSONDecodeError))
+
+
+class Histogram:
+    """Cumulative bucket counts plus a bounded window of samples for percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, max_samples=10_000):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max_samples = max_samples
+        self._samples = []
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+        self._samples.append(value)
+        if len(self._samples) > self.max_samples:
+            del self._samples[: len(self._samples) - self.max_samples]
+
+    def percentile(self, q):
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class _Series:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.validation_failures = 0
+        self.retries = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.latency = Histogram()
+
+
+class MetricsRecorder:
+    """In-process metrics per (prompt template, backend, model)"""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _get(self, template, backend, model):
+        key = (template or "UNKNOWN", backend, model)
+        series = self._series.get(key)
+        if series is None:
+            series = _Series()
+            self._series[key] = series
+        return series
+
+    def record_call(self, template, backend, model, latency, usage=None, error=None):
+        with self._lock:
+            series = self._get(template, backend, model)
+            series.calls += 1
+            series.latency.observe(latency)
+            if usage:
+                series.input_tokens += usage.get("input_tokens", 0)
+                series.output_tokens += usage.get("output_tokens", 0)
+                series.cached_tokens += usage.get("cached_tokens", 0)
+            if error is not None:
+                series.errors += 1
+                if _is_validation_error(error):
+                    series.validation_failures += 1
+
+    def record_retry(self, template, backend, model):
+        with self._lock:
+            self._get(template, backend, model).retries += 1
+
+    def snapshot(self):
+        """List of per-series dicts with counts, token totals and latency percentiles"""
+        with self._lock:
+            rows = []
+            for (template, backend, model), s in sorted(self._series.items()):
+                rows.append({
+                    "template": template,
+                    "backend": backend,
+                    "model": model,
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "validation_failures": s.validation_failures,
+                    "retries": s.retries,
+                    "input_tokens": s.input_tokens,
+                    "output_tokens": s.output_tokens,
+                    "cached_tokens": s.cached_tokens,
+                    "latency_total": s.latency.total,
+                    "latency_p50": s.latency.percentile(50),
+                    "latency_p95": s.latency.percentile(95),
+                    "latency_p99": s.latency.percentile(99)
+                })
+            return rows
+
+    def summary(self):
+        """Human readable table of the snapshot"""
+        lines = [f"{'template':<32}{'calls':>7}{'err':>5}{'retry':>7}{'in_tok':>9}{'out_tok':>9}{'p50':>8}{'p95':>8}{'p99':>8}"]
+        for row in self.snapshot():
+            lines.append(
+                f"{row['template']:<32}{row['calls']:>7}{row['errors']:>5}{row['retries']:>7}"
+                f"{row['input_tokens']:>9}{row['output_tokens']:>9}"
+                f"{row['latency_p50']:>8.3f}{row['latency_p95']:>8.3f}{row['latency_p99']:>8.3f}"
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        counters = [
+            ("llm_calls_total", "calls", "LLM calls"),
+            ("llm_errors_total", "errors", "LLM calls that raised"),
+            ("llm_validation_failures_total", "validation_failures", "Responses that failed schema validation"),
+            ("llm_retries_total", "retries", "Retried LLM calls"),
+            ("llm_input_tokens_total", "input_tokens", "Input tokens reported by the provider"),
+            ("llm_output_tokens_total", "output_tokens", "Output tokens reported by the provider"),
+            ("llm_cached_input_tokens_total", "cached_tokens", "Input tokens served from the provider prompt cache"),
+        ]
+        with self._lock:
+            items = sorted(self._series.items())
+            out = []
+            for name, attr, help_text in counters:
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} counter")
+                for key, s in items:
+                    out.append(f"{name}{{{_labels(key)}}} {getattr(s, attr)}")
+
+            out.append("# HELP llm_latency_seconds LLM call latency")
+            out.append("# TYPE llm_latency_seconds histogram")
+            for key, s in items:
+                labels = _labels(key)
+                cumulative = 0
+                for bound, count in zip(s.latency.buckets, s.latency.counts):
+                    cumulative += count
+                    out.append(f'llm_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                out.append(f'llm_latency_seconds_bucket{{{labels},le="+Inf"}} {s.latency.count}')
+                out.append(f"llm_latency_seconds_sum{{{labels}}} {s.latency.total}")
+                out.append(f"llm_latency_seconds_count{{{labels}}} {s.latency.count}")
+        return "\n".join(out) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.started_at = time.time()
+
+
+def _labels(key):
+    template, backend, model = key
+    values = [("template", template), ("backend", backend), ("model", model)]
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in values)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsInterceptor:
+    """Wrapper that records latency, token usage and failures of every call"""
+
+    def __init__(self, llm_wrapper, recorder, backend="LLMWrapper", model=""):
+        self.wrapper = llm_wrapper
+        self.recorder = recorder
+        self.backend = backend
+        self.model = model
+
+    def generate(self, text, fmt):
+        usage = {}
+        token = _current_usage.set(usage)
+        start_time = time.time()
+        try:
+            response = self.wrapper.generate(text, fmt)
+        except Exception as e:
+            self.recorder.record_call(getattr(text, "template_name", ""), self.backend, self.model, time.time() - start_time, usage, e)
+            raise
+        finally:
+            _current_usage.reset(token)
+        self.recorder.record_call(getattr(text, "template_name", ""), self.backend, self.model, time.time() - start_time, usage)
+        return response
+
+    async def agenerate(self, text, fmt):
+        usage = {}
+        token = _current_usage.set(usage)
+        start_time = time.time()
+        try:
+            response = await self.wrapper.agenerate(text, fmt)
+        except Exception as e:
+            self.recorder.record_call(getattr(text, "template_name", ""), self.backend, self.model, time.time() - start_time, usage, e)
+            raise
+        finally:
+            _current_usage.reset(token)
+        self.recorder.record_call(getattr(text, "template_name", ""), self.backend, self.model, time.time() - start_time, usage)
+        return response
@@ -0,0 +1,71 @@
+import re
+import json
+import threading
+from pathlib import Path
+from ast_rl import from_dict
+
+
+def normalize_sentence(text):
+    """Key used to recognise the same clause across different parent prompts"""
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip(".!;: ").strip("'\" ")
+
+
+class ParseMemo:
+    """Memo of parsed ast_rl subtrees keyed by normalized sentence text.
+
+    Lives for the lifetime of a pipeline; when `path` is given, entries are
+    appended to a JSONL file and reloaded on the next run.
+    """
+
+    def __init__(self, path=None, namespace=""):
+        self.path = Path(path) if path is not None else None
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._trees = {}
+        self._lock = threading.Lock()
+
+        if self.path is not None and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    if entry.get("namespace", "") != self.namespace:
+                        continue
+                    self._trees[entry["key"]] = from_dict(entry["tree"])
+
+    def get(self, text):
+        key = normalize_sentence(text)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return tree
+
+    def put(self, text, tree):
+        key = normalize_sentence(text)
+        with self._lock:
+            if key in self._trees:
+                return
+            self._trees[key] = tree
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"namespace": self.namespace, "key": key, "tree": tree.to_dict()}, ensure_ascii=False) + "\n")
+
+    def __len__(self):
+        return len(self._trees)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._trees)
+        }
@@ -1,99 +1,491 @@
 from ast_rl import *
 from dotenv import load_dotenv
-from ollama import generate
-from openai import OpenAI
 from structured_output import *
-from google import genai
-from google.genai import types
+from clients import get_openai_client, get_ollama_client, get_gemini_client
 from api_logger import APILogger, LLMInterceptor
+from llm_cache import LLMCache, CachedLLM
+from parse_memo import ParseMemo, normalize_sentence
+from metrics import MetricsRecorder, MetricsInterceptor, report_usage
+from resilience import ResiliencePolicy, ResilientLLM
+from local_classifier import LocalClassifier, LocalClassifierLLM
+from speculation import Speculator
+from replay import LLMRecorder, ReplayWrapper
+from tracing import Tracer, TracedLLM, traced, annotate
+from budget import ParseBudget, BudgetExceeded, BudgetedLLM, sentence_scope, contract_scope, exhausted, record_collapse
+import asyncio
 import os
+import re
+import threading
+import time
 load_dotenv()
 
+def _chat_messages(text):
+    """System message with the static template, user message with the sentence"""
+    if isinstance(text, Prompt):
+        return [
+            {"role": "system", "content": text.template},
+            {"role": "user", "content": text.suffix}
+        ]
+    return [{"role": "user", "content": text}]
+
+def _report_openai_usage(usage):
+    # Responses API reports input/output tokens, chat completions prompt/completion tokens
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+    report_usage(
+        getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None),
+        getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None),
+        getattr(details, "cached_tokens", None)
+    )
+
+def _report_gemini_usage(usage):
+    if usage is None:
+        return
+    report_usage(usage.prompt_token_count, usage.candidates_token_count, usage.cached_content_token_count)
+
 class OpenAIWrapper:
-    def __init__(self, model):
+    def __init__(self, model, max_connections=None, timeout=None):
         self.model = model
-        self.client = OpenAI()
-    
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.client = get_openai_client(max_connections=max_connections, timeout=timeout)
+
+    def _cache_args(self, text):
+        # Route requests sharing a template to the same prompt-cache shard
+        if isinstance(text, Prompt) and text.template_name:
+            return {"prompt_cache_key": text.template_name}
+        return {}
+
     def generate(self, text, fmt):
         response = self.client.responses.parse(
             model=self.model,
-            input=[
-                {"role": "user", "content": text}
-            ],
-            text_format=fmt
+            input=_chat_messages(text),
+            text_format=fmt,
+            **self._cache_args(text)
         )
+        _report_openai_usage(response.usage)
         return response.output_parsed
 
-    
+    async def agenerate(self, text, fmt):
+        # Async clients are per event loop, so look the pooled one up on every call
+        aclient = get_openai_client(max_connections=self.max_connections, timeout=self.timeout, asynchronous=True)
+        response = await aclient.responses.parse(
+            model=self.model,
+            input=_chat_messages(text),
+            text_format=fmt,
+            **self._cache_args(text)
+        )
+        _report_openai_usage(response.usage)
+        return response.output_parsed
+
+
 class OllamaWrapper:
-    def __init__(self, model):
+    def __init__(self, model, host=None, max_connections=None, timeout=None):
         self.model = model
+        self.host = host
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.client = get_ollama_client(host, max_connections=max_connections, timeout=timeout)
+
+    def _prompt_args(self, text):
+        if isinstance(text, Prompt):
+            return {"system": text.template, "prompt": text.suffix}
+        return {"prompt": text}
 
     def generate(self, text, fmt):
-        result = generate(
+        result = self.client.generate(
             model= self.model,
-            prompt= text,
+            **self._prompt_args(text),
             stream=False,
             format=fmt.model_json_schema(),
             options={'temperature': 0}
         )
+        report_usage(result.prompt_eval_count, result.eval_count)
+        return fmt.model_validate_json(result.response)
+
+    async def agenerate(self, text, fmt):
+        aclient = get_ollama_client(self.host, max_connections=self.max_connections, timeout=self.timeout, asynchronous=True)
+        result = await aclient.generate(
+            model= self.model,
+            **self._prompt_args(text),
+            stream=False,
+            format=fmt.model_json_schema(),
+            options={'temperature': 0}
+        )
+        report_usage(result.prompt_eval_count, result.eval_count)
         return fmt.model_validate_json(result.response)
 
 class VLLMWrapper:
-    def __init__(self, model, url="http://0.0.0.0:8000/v1"):
+    def __init__(self, model, url="http://0.0.0.0:8000/v1", max_connections=None, timeout=60):
         self.model = model
         self.url = url
-    
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.client = get_openai_client(base_url=url, max_connections=max_connections, timeout=timeout)
+
     def generate(self, text, fmt):
-        client = OpenAI(base_url=self.url)
-        response = client.beta.chat.completions.parse(
+        response = self.client.beta.chat.completions.parse(
+            model=self.model,
+            messages=_chat_messages(text),
+            response_format=fmt,
+            temperature=0,
+            timeout=self.timeout
+        )
+        _report_openai_usage(response.usage)
+        return response.choices[0].message.parsed
+
+    async def agenerate(self, text, fmt):
+        aclient = get_openai_client(base_url=self.url, max_connections=self.max_connections, timeout=self.timeout, asynchronous=True)
+        response = await aclient.beta.chat.completions.parse(
             model=self.model,
-            messages=[
-                {"role": "user", "content": text}
-            ],
+            messages=_chat_messages(text),
             response_format=fmt,
             temperature=0,
-            timeout=60
+            timeout=self.timeout
         )
-        client.close()
+        _report_openai_usage(response.usage)
         return response.choices[0].message.parsed
 
 class GeminiWrapper:
-    def __init__(self, model):
+    def __init__(self, model, max_connections=None, timeout=None, context_cache=False, cache_ttl="3600s"):
         self.model = model
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.client = get_gemini_client(max_connections=max_connections, timeout=timeout)
+        # Explicit cached-content (name, expiry) per template name (None = creation failed).
+        # A handle is recreated CACHE_RENEW_MARGIN seconds before its ttl runs out.
+        self.context_cache = context_cache
+        self.cache_ttl = cache_ttl
+        self.cached_contents = {}
+        self._cache_lock = threading.Lock()
+
+    CACHE_RENEW_MARGIN = 120  # seconds
+
+    def _cached_content(self, text):
+        if not self.context_cache or not text.template_name:
+            return None
+        with self._cache_lock:
+            entry = self.cached_contents.get(text.template_name, False)
+            if entry and entry[1] - time.time() < self.CACHE_RENEW_MARGIN:
+                entry = False
+            if entry is False:
+                from google.genai import types
+                try:
+                    cache = self.client.caches.create(
+                        model=self.model,
+                        config=types.CreateCachedContentConfig(
+                            display_name=text.template_name,
+                            system_instruction=text.template,
+                            ttl=self.cache_ttl
+                        )
+                    )
+                    ttl = float(str(self.cache_ttl).rstrip("s"))
+                    self.cached_contents[text.template_name] = (cache.name, time.time() + ttl)
+                except Exception:
+                    # Templates below the provider's minimum cacheable size
+                    # keep using the plain system instruction
+                    self.cached_contents[text.template_name] = None
+            entry = self.cached_contents[text.template_name]
+            return entry[0] if entry else None
+
+    def _expire_cached_content(self, text, config):
+        """Drop the handle a failed request used; True if the request should be retried"""
+        if not isinstance(text, Prompt) or getattr(config, "cached_content", None) is None:
+            return False
+        with self._cache_lock:
+            entry = self.cached_contents.get(text.template_name)
+            if entry and entry[0] == config.cached_content:
+                del self.cached_contents[text.template_name]
+        return True
+
+    @staticmethod
+    def _is_missing_cache(error):
+        # The API answers 403/404 for a cached content that expired or was deleted
+        status = getattr(error, "code", None) or getattr(error, "status_code", None)
+        return status in (403, 404) and "cache" in str(error).lower()
+
+    def _request(self, text, fmt):
+        from google.genai import types
+        config = dict(
+            response_mime_type="application/json",
+            response_schema=fmt,
+            temperature=0
+        )
+        if not isinstance(text, Prompt):
+            return text, types.GenerateContentConfig(**config)
+        cached_content = self._cached_content(text)
+        if cached_content is not None:
+            config["cached_content"] = cached_content
+        else:
+            config["system_instruction"] = text.template
+        return text.suffix, types.GenerateContentConfig(**config)
+
     def generate(self, text, fmt):
-        response = self.client.models.generate_content(
-            contents = text,
-            model=self.model,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=fmt,
-                temperature=0
+        contents, config = self._request(text, fmt)
+        try:
+            response = self.client.models.generate_content(
+                contents = contents,
+                model=self.model,
+                config=config
             )
-        )
+        except Exception as e:
+            if not (self._is_missing_cache(e) and self._expire_cached_content(text, config)):
+                raise
+            contents, config = self._request(text, fmt)
+            response = self.client.models.generate_content(
+                contents = contents,
+                model=self.model,
+                config=config
+            )
+        _report_gemini_usage(response.usage_metadata)
         return fmt.model_validate_json(response.text)
 
+    async def agenerate(self, text, fmt):
+        contents, config = self._request(text, fmt)
+        aclient = get_gemini_client(max_connections=self.max_connections, timeout=self.timeout, asynchronous=True)
+        try:
+            response = await aclient.aio.models.generate_content(
+                contents = contents,
+                model=self.model,
+                config=config
+            )
+        except Exception as e:
+            if not (self._is_missing_cache(e) and self._expire_cached_content(text, config)):
+                raise
+            contents, config = self._request(text, fmt)
+            response = await aclient.aio.models.generate_content(
+                contents = contents,
+                model=self.model,
+                config=config
+            )
+        _report_gemini_usage(response.usage_metadata)
+        return fmt.model_validate_json(response.text)
+
+
+# Stage-two prompts for each ChooseRelation answer
+RELATION_PARSERS = {
+    'A': (ADJECTIVE_SYSTEM_PROMPT, AdjectiveParser),
+    'B': (INTRANSITIVE_SYSTEM_PROMPT, IntransitiveParser),
+    'C': (TRANSITIVE_SYSTEM_PROMPT, TransitiveParser),
+    'D': (DITRANSITIVE_SYSTEM_PROMPT, DitransitiveParser),
+}
+
+def _rephrase_prompt(text):
+    return Prompt(REPHRASE_SYSTEM_PROMPT, 'Now, it is your turn\n\nInput: "' + text + '"\nRephrased: ', text)
+
+def _input_prompt(system_prompt, text):
+    return Prompt(system_prompt, 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', text)
+
+def _classify_prompt(text):
+    return Prompt(CHOOSE_PARSER_SYSTEM_PROMPT, "Now, classify this\n\nSentence: '" + text + "'\nAnswer: ", text)
+
+def _parser_followups(text):
+    """Stage-two prompt for each ChooseParser answer"""
+    return {
+        'A': (_input_prompt(CHOOSE_RELATION_SYSTEM_PROMPT, text), ChooseRelation),
+        'B': (_input_prompt(QUANTIFIED_SYSTEM_PROMPT, text), QuantifiedParser),
+        'C': (_input_prompt(BINARY_LOGICAL_SYSTEM_PROMPT, text), BinaryLogicalParser),
+        'D': (_input_prompt(UNARY_LOGICAL_SYSTEM_PROMPT, text), UnaryLogicalParser),
+    }
+
+def _relation_followups(text):
+    return {a: (_input_prompt(system_prompt, text), fmt) for a, (system_prompt, fmt) in RELATION_PARSERS.items()}
+
+def _depth(prefix):
+    # Every tree level adds one 5-character segment to the log prefix
+    return len(prefix) // 5
+
+def _relation_node(answer, p):
+    """Build the relation node and its log line from a relation parser output"""
+    if answer == 'A':
+        return (RelationAdjective(obj=Constant(name=p.obj), adjective=p.adjective),
+                f"Adjective parser. Adjective: {p.adjective}, Object: {p.obj}")
+    elif answer == 'B':
+        return (RelationIntransitiveVerb(verb=p.verb, subject=Constant(name=p.subject)),
+                f"Intransitive parser. Verb: {p.verb}, Subject: {p.subject}")
+    elif answer == 'C':
+        return (RelationTransitiveVerb(verb=p.verb, subject=Constant(name=p.subject), obj=Constant(name=p.obj)),
+                f"Transitive parser. Verb: {p.verb}, Subject: {p.subject}, Object: {p.obj}")
+    elif answer == 'D':
+        return (RelationDitransitiveVerb(verb=p.verb, subject=Constant(name=p.subject), indirect_obj=Constant(name=p.indirect_obj), direct_obj=Constant(name=p.direct_obj)),
+                f"Ditransitive parser. Verb: {p.verb}, Subject: {p.subject}, Indirect Object: {p.indirect_obj}, Direct Object: {p.direct_obj}")
+    else:
+        raise ValueError("Invalid relation option")
+
+# Relation kinds of the fused parser mapped to their ChooseRelation answer
+FUSED_RELATION_KINDS = {
+    'adjective': 'A',
+    'intransitive': 'B',
+    'transitive': 'C',
+    'ditransitive': 'D',
+}
+
+PARSE_STRATEGIES = ("cascade", "fused", "oneshot")
+
+RELATION_ARITY = {
+    'adjective': 1,
+    'intransitive': 1,
+    'transitive': 2,
+    'ditransitive': 3,
+}
+
+VARIABLE_NAME = re.compile(r"^[a-z][0-9]*$")
+
+class _OneShotInvalid(Exception):
+    """A one-shot node failed validation and carries no text to re-parse"""
+
+def _oneshot_relation(node, bound):
+    terms = []
+    for arg in node.arguments:
+        arg = arg.strip()
+        if arg == "":
+            return None
+        if arg in bound:
+            terms.append(Variable(name=arg))
+        elif VARIABLE_NAME.match(arg):
+            # Free variable: not bound by any enclosing quantifier
+            return None
+        else:
+            terms.append(Constant(name=arg))
+    if node.kind == 'adjective':
+        return RelationAdjective(adjective=node.predicate, obj=terms[0])
+    elif node.kind == 'intransitive':
+        return RelationIntransitiveVerb(verb=node.predicate, subject=terms[0])
+    elif node.kind == 'transitive':
+        return RelationTransitiveVerb(verb=node.predicate, subject=terms[0], obj=terms[1])
+    else:
+        return RelationDitransitiveVerb(verb=node.predicate, subject=terms[0], indirect_obj=terms[1], direct_obj=terms[2])
+
+def _oneshot_plan(nodes, i, bound=frozenset(), path=frozenset()):
+    """Validate the one-shot node list from index i into a build plan.
+
+    Valid nodes become ('relation', node) / ('quantified', q, var, child) /
+    ('binary', op, left, right) / ('unary', op, child); a subtree that fails
+    validation becomes ('fallback', text) so only it is re-parsed per node.
+    """
+    if i < 0 or i >= len(nodes) or i in path:
+        raise _OneShotInvalid()
+    node = nodes[i]
+    path = path | {i}
+
+    def fallback():
+        if node.text.strip() == "":
+            raise _OneShotInvalid()
+        return ('fallback', node.text.strip())
+
+    try:
+        if node.kind in RELATION_ARITY:
+            if node.predicate.strip() == "" or node.children or len(node.arguments) != RELATION_ARITY[node.kind]:
+                return fallback()
+            relation = _oneshot_relation(node, bound)
+            return fallback() if relation is None else ('relation', relation)
+        elif node.kind == 'quantified':
+            variable = node.variable.strip()
+            if node.quantifier not in ("ForAll", "ThereExists") or not VARIABLE_NAME.match(variable) or len(node.children) != 1:
+                return fallback()
+            return ('quantified', node.quantifier, variable, _oneshot_plan(nodes, node.children[0], bound | {variable}, path))
+        elif node.kind == 'binary':
+            if node.operator not in ("And", "Or", "If", "OnlyIf", "IfAndOnlyIf") or len(node.children) != 2:
+                return fallback()
+            return ('binary', node.operator,
+                    _oneshot_plan(nodes, node.children[0], bound, path),
+                    _oneshot_plan(nodes, node.children[1], bound, path))
+        elif node.kind == 'unary':
+            if node.operator != "Not" or len(node.children) != 1:
+                return fallback()
+            return ('unary', node.operator, _oneshot_plan(nodes, node.children[0], bound, path))
+        else:
+            return fallback()
+    except _OneShotInvalid:
+        # A child could not be recovered on its own; re-parse this whole subtree
+        return fallback()
+
+def _quantified_is_atomic(text, p):
+    return p.sentence_without_quantifier.lower() == text.lower() or p.sentence_without_quantifier == ""
+
+def _binary_is_atomic(text, p):
+    return p.left_operand.lower() == text.lower() or p.right_operand.lower() == text.lower() or p.left_operand == "" or p.right_operand == ""
+
+def _unary_is_atomic(text, p):
+    for w in ["not", "do not", "dont", "don't", "does not", "doesn't"]:
+        if w not in text.lower() and w in p.operand.lower():
+            return True
+    return p.operand.lower() == text.lower() or p.operand.lower() == ""
+
+def _tree_prefixes(last):
+    if last:
+        return "     ", "└────"
+    else:
+        return "│    ", "├────"
+
 class Pipeline:
-    def __init__(self, llm, model, logging=False, url="http://0.0.0.0:8000/v1"):
+    def __init__(self, llm, model, logging=False, url="http://0.0.0.0:8000/v1", cache=None, memo=True, strategy="cascade",
+                 max_connections=None, timeout=None, context_cache=False, metrics=None,
+                 resilience=True, local_classifier=None, classifier_threshold=0.9,
+                 speculative=False, record=None, budget=None, contract_budget=None, trace=None):
+        # max_connections bounds the keep-alive pool shared per backend,
+        # timeout (seconds) applies to every call,
+        # context_cache creates explicit Gemini cached content per template
+        # llm='replay' serves a recording (model = its path) instead of a provider,
+        # a wrapper object with generate/agenerate is used as is
         if llm == 'openai':
-            wrapper = OpenAIWrapper(model)
+            wrapper = OpenAIWrapper(model, max_connections, timeout)
             wrapper_name = "OpenAIWrapper"
         elif llm == 'ollama':
-            wrapper = OllamaWrapper(model)
+            wrapper = OllamaWrapper(model, max_connections=max_connections, timeout=timeout)
             wrapper_name = "OllamaWrapper"
         elif llm == 'vllm':
-            wrapper = VLLMWrapper(model,url)
+            wrapper = VLLMWrapper(model, url, max_connections, timeout or 60)
             wrapper_name = "VLLMWrapper"
         elif llm == 'gemini':
-            wrapper = GeminiWrapper(model)
+            wrapper = GeminiWrapper(model, max_connections, timeout, context_cache)
             wrapper_name = "GeminiWrapper"
-        else: 
+        elif llm == 'replay':
+            wrapper = ReplayWrapper(model)
+            wrapper_name = "ReplayWrapper"
+        elif hasattr(llm, "generate"):
+            # Any wrapper object, e.g. a configured ReplayWrapper or a benchmark stub
+            wrapper = llm
+            wrapper_name = type(llm).__name__
+        else:
             raise ValueError("LLM is not valid")
-        
+
+        # Append every provider response to a JSONL recording for ReplayWrapper.
+        # Pass True for a timestamped file under .recordings/ or a path.
+        if record:
+            wrapper = LLMRecorder(wrapper, None if record is True else record, wrapper_name, model)
+
+        if strategy not in PARSE_STRATEGIES:
+            raise ValueError(f"Parse strategy is not valid: {strategy}")
+        # cascade: classify then extract (2-3 calls per node)
+        # fused: one call classifies and extracts each node
+        # oneshot: one call for the whole formula, cascade for invalid subtrees
+        self.strategy = strategy
         self.logging = logging
-        
+
+        # Per-template latency, token and failure metrics of the provider calls.
+        # Pass True for a fresh MetricsRecorder or share an existing one.
+        if metrics:
+            self.metrics = metrics if isinstance(metrics, MetricsRecorder) else MetricsRecorder()
+            wrapper = MetricsInterceptor(wrapper, self.metrics, wrapper_name, model)
+        else:
+            self.metrics = None
+
+        # Retries with backoff, rate limits and adaptive concurrency per provider/model.
+        # Pass a ResiliencePolicy to configure it or False to call the provider directly.
+        if resilience:
+            policy = resilience if isinstance(resilience, ResiliencePolicy) else ResiliencePolicy()
+            wrapper = ResilientLLM(wrapper, wrapper_name, model, policy, self.metrics)
+
+        # Cap LLM calls, depth and wall time per sentence (budget) and per contract
+        # (contract_budget, applied inside contract_scope()). Once a budget is spent
+        # the remaining subtree becomes a RelationOpaque node.
+        self.budget = budget
+        self.contract_budget = contract_budget
+        if budget is not None or contract_budget is not None:
+            wrapper = BudgetedLLM(wrapper)
+
         # Wrap with interceptor if logging is enabled
         if self.logging:
             self.api_logger = APILogger(
@@ -103,131 +495,480 @@ class Pipeline:
         else:
             self.llm = wrapper
 
+        # Serve repeated prompts from the on-disk response cache.
+        # Pass True for the default cache or an LLMCache to configure it.
+        if cache:
+            self.cache = cache if isinstance(cache, LLMCache) else LLMCache()
+            self.llm = CachedLLM(self.llm, self.cache, wrapper_name, model)
+        else:
+            self.cache = None
+
+        # Answer ChooseParser/ChooseRelation in-process when the local classifier
+        # is at least classifier_threshold confident. Pass a model path or a LocalClassifier.
+        if local_classifier is not None:
+            if not isinstance(local_classifier, LocalClassifier):
+                local_classifier = LocalClassifier.load(local_classifier)
+            self.llm = LocalClassifierLLM(self.llm, local_classifier, classifier_threshold)
+
+        # Reuse parsed subtrees of repeated clauses. True keeps them in memory,
+        # a path also persists them across runs, or pass a ParseMemo.
+        if isinstance(memo, ParseMemo):
+            self.memo = memo
+        elif memo:
+            self.memo = ParseMemo(None if memo is True else memo, namespace=f"{wrapper_name}:{model}:{strategy}")
+        else:
+            self.memo = None
+
+        # Record parse steps and LLM calls as nested spans. Pass True or a Tracer;
+        # export with self.tracer.export(path), see tracer.critical_path_summary().
+        if trace:
+            self.tracer = trace if isinstance(trace, Tracer) else Tracer()
+            self.llm = TracedLLM(self.llm, self.tracer)
+        else:
+            self.tracer = None
+
+        # Send the likely next-stage prompt together with each classifier call,
+        # using per-depth answer priors. Pass True or a configured Speculator.
+        if isinstance(speculative, Speculator):
+            self.speculator = speculative
+        elif speculative:
+            self.speculator = Speculator()
+        else:
+            self.speculator = None
+
     def log(self, text):
         if self.logging:
             print(text)
-        
+
+    def close(self):
+        """Release the API logger, so its writer thread stops once no pipeline uses it"""
+        if self.logging:
+            self.api_logger.close()
+
     def _rephrase(self, text):
-        r = self.llm.generate(
-                REPHRASE_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nRephrased: ', 
-                Rephrased
-            )
+        r = self.llm.generate(_rephrase_prompt(text), Rephrased)
         self.log(f"Rephrased '{text}' to '{r.rephrased}'")
         return r.rephrased
-    
+
+    def contract_scope(self):
+        """Context manager charging every sentence parsed inside it to contract_budget"""
+        return contract_scope(self.contract_budget)
+
+    def _collapse(self, text, reason, prefix=""):
+        record_collapse(text, reason)
+        annotate(collapsed=reason)
+        self.log( prefix + f"Budget exhausted ({reason}), keeping '{text}' opaque")
+        return RelationOpaque(clause=text, reason=reason)
+
+    @traced("rule")
     def rephrase_and_parse(self, text):
-        text = self._rephrase(text)
-        return self.parse(text, True, "")
-        
-    def _parse_relation(self, text, prefix):
-        choose_relation = self.llm.generate(
-                    CHOOSE_RELATION_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                    ChooseRelation)
-        answer = choose_relation.answer
-        if answer == 'A':
-            # Adjective
-            p = self.llm.generate(
-                ADJECTIVE_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                AdjectiveParser
-            )
-            self.log(prefix + f"Adjective parser. Adjective: {p.adjective}, Object: {p.obj}")
-            return RelationAdjective(obj=Constant(name=p.obj), adjective=p.adjective)
-        elif answer == 'B':
-            # Intransitive
-            p = self.llm.generate(
-                INTRANSITIVE_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                IntransitiveParser
-            )
-            self.log(prefix + f"Intransitive parser. Verb: {p.verb}, Subject: {p.subject}")
-            return RelationIntransitiveVerb(verb=p.verb, subject=Constant(name=p.subject))
-        elif answer == 'C':
-            # Transitive
-            p = self.llm.generate(
-                TRANSITIVE_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                TransitiveParser
-            )
-            self.log(prefix + f"Transitive parser. Verb: {p.verb}, Subject: {p.subject}, Object: {p.obj}")
-            return RelationTransitiveVerb(verb=p.verb, subject=Constant(name=p.subject), obj=Constant(name=p.obj))
-        elif answer == 'D':
-            # Ditransitive
-            p = self.llm.generate(
-                DITRANSITIVE_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                DitransitiveParser
-            )
-            self.log(prefix + f"Ditransitive parser. Verb: {p.verb}, Subject: {p.subject}, Indirect Object: {p.indirect_obj}, Direct Object: {p.direct_obj}")
-            return RelationDitransitiveVerb(verb=p.verb, subject=Constant(name=p.subject), indirect_obj=Constant(name=p.indirect_obj), direct_obj=Constant(name=p.direct_obj))
+        with sentence_scope(self.budget):
+            try:
+                text = self._rephrase(text)
+            except BudgetExceeded as e:
+                return self._collapse(text, e.reason)
+            if self.strategy == "oneshot":
+                return self.parse_oneshot(text, True, "")
+            return self.parse(text, True, "")
+
+    @traced("parse.oneshot")
+    def parse_oneshot(self, text, last, prefix):
+        """Parse the whole formula with one call, re-parsing only invalid subtrees per node"""
+        p, q = _tree_prefixes(last)
+        self.log( prefix + q + f"One-shot parsing '{text}'")
+        prefix += p
+        annotate(depth=_depth(prefix))
+        if self.memo is not None:
+            tree = self.memo.get(text)
+            if tree is not None:
+                self.log( prefix + f"Reused parse: {tree}")
+                annotate(memo_hit=True)
+                return tree
+        try:
+            r = self.llm.generate(_input_prompt(ONESHOT_SYSTEM_PROMPT, text), OneShotParser)
+        except BudgetExceeded as e:
+            return self._collapse(text, e.reason, prefix)
+        try:
+            plan = _oneshot_plan(r.nodes, 0)
+        except _OneShotInvalid:
+            plan = ('fallback', text)
+        self.log( prefix + f"One-shot parser. Nodes: {len(r.nodes)}")
+        tree = self._build_oneshot(plan, True, prefix)
+        if self.memo is not None and not is_degraded(tree):
+            self.memo.put(text, tree)
+        return tree
+
+    def _build_oneshot(self, plan, last, prefix):
+        kind = plan[0]
+        if kind == 'fallback':
+            self.log( prefix + "Invalid one-shot subtree, falling back")
+            return self.parse(plan[1], last, prefix)
+        elif kind == 'relation':
+            return plan[1]
+        elif kind == 'quantified':
+            s = self._build_oneshot(plan[3], True, prefix)
+            return QuantifiedSentence(quantifier=plan[1], variable=Variable(name=plan[2]), sentence=s)
+        elif kind == 'binary':
+            left = self._build_oneshot(plan[2], False, prefix)
+            right = self._build_oneshot(plan[3], True, prefix)
+            return BinaryOperator(operator=plan[1], left=left, right=right)
         else:
+            s = self._build_oneshot(plan[2], True, prefix)
+            return UnaryOperator(operator=plan[1], sentence=s)
+
+    @traced("parse.relation")
+    def _parse_relation(self, text, prefix, choose_relation=None):
+        p = None
+        if choose_relation is None and self.speculator is not None:
+            choose_relation, p = self.speculator.run(
+                self.llm, "relation", _depth(prefix),
+                (_input_prompt(CHOOSE_RELATION_SYSTEM_PROMPT, text), ChooseRelation), _relation_followups(text))
+        elif choose_relation is None:
+            choose_relation = self.llm.generate(_input_prompt(CHOOSE_RELATION_SYSTEM_PROMPT, text), ChooseRelation)
+        answer = choose_relation.answer
+        annotate(decision=answer)
+        if answer not in RELATION_PARSERS:
             raise ValueError("Invalid relation option")
-        
-    def _parse_quantified(self, text, prefix):
-        p = self.llm.generate(
-                QUANTIFIED_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                QuantifiedParser
-            )
+        if p is None:
+            system_prompt, fmt = RELATION_PARSERS[answer]
+            p = self.llm.generate(_input_prompt(system_prompt, text), fmt)
+        node, message = _relation_node(answer, p)
+        self.log(prefix + message)
+        return node
+
+    @traced("parse.quantified")
+    def _parse_quantified(self, text, prefix, p=None):
+        if p is None:
+            p = self.llm.generate(_input_prompt(QUANTIFIED_SYSTEM_PROMPT, text), QuantifiedParser)
         self.log(prefix + f"Quantified parser. Quantifier: {p.quantifier}, Variable: {p.variable}")
-        if p.sentence_without_quantifier.lower() == text.lower() or p.sentence_without_quantifier == "":
+        if _quantified_is_atomic(text, p):
             return self._parse_relation(text, prefix)
         else:
             s = self.parse(p.sentence_without_quantifier, True, prefix)
             return QuantifiedSentence(quantifier=p.quantifier, variable=Variable(name=p.variable if p.variable != "" else "x"), sentence=s)
 
-    def _parse_binary(self, text, prefix):
-        p = self.llm.generate(
-                BINARY_LOGICAL_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-                BinaryLogicalParser
-            )
+    @traced("parse.binary")
+    def _parse_binary(self, text, prefix, p=None):
+        if p is None:
+            p = self.llm.generate(_input_prompt(BINARY_LOGICAL_SYSTEM_PROMPT, text), BinaryLogicalParser)
         self.log(prefix + f"Binary operator parser. Operator: {p.operator}")
-        if p.left_operand.lower() == text.lower() or p.right_operand.lower() == text.lower() or p.left_operand == "" or p.right_operand == "":
+        if _binary_is_atomic(text, p):
             return self._parse_relation(text, prefix)
         else:
             left = self.parse(p.left_operand, False, prefix)
             right = self.parse(p.right_operand, True, prefix)
             return BinaryOperator(operator=p.operator, left=left, right=right)
-    
-    def _parse_unary(self, text, prefix):
-        p = self.llm.generate(
-            UNARY_LOGICAL_SYSTEM_PROMPT + 'Now, it is your turn\n\nInput: "' + text + '"\nOutput: ', 
-            UnaryLogicalParser
-        )
+
+    @traced("parse.unary")
+    def _parse_unary(self, text, prefix, p=None):
+        if p is None:
+            p = self.llm.generate(_input_prompt(UNARY_LOGICAL_SYSTEM_PROMPT, text), UnaryLogicalParser)
         self.log(prefix + f"Unary operator parser. Operator: {p.operator}")
-        for w in ["not", "do not", "dont", "don't", "does not", "doesn't"]:
-            if w not in text.lower() and w in p.operand.lower():
-                return self._parse_relation(text, prefix)
-        if p.operand.lower() == text.lower() or p.operand.lower() == "":
+        if _unary_is_atomic(text, p):
             return self._parse_relation(text, prefix)
         else:
             s = self.parse(p.operand, True, prefix)
             return UnaryOperator(operator=p.operator, sentence=s)
 
+    @traced("parse")
     def parse(self, text, last, prefix):
-        if last:
-            p = "     "
+        p, q = _tree_prefixes(last)
+        self.log( prefix + q + f"Parsing '{text}'")
+        prefix += p
+        annotate(depth=_depth(prefix))
+        if self.memo is not None:
+            tree = self.memo.get(text)
+            if tree is not None:
+                self.log( prefix + f"Reused parse: {tree}")
+                annotate(memo_hit=True)
+                return tree
+        tree = self._parse_within_budget(text, prefix)
+        if self.memo is not None and not is_degraded(tree):
+            self.memo.put(text, tree)
+        return tree
+
+    def _parse_within_budget(self, text, prefix):
+        """_parse, or an opaque node once the sentence/contract budget is spent"""
+        reason = exhausted(_depth(prefix))
+        if reason is None:
+            try:
+                return self._parse(text, prefix)
+            except BudgetExceeded as e:
+                reason = e.reason
+        return self._collapse(text, reason, prefix)
+
+    @traced("parse.fused")
+    def _parse_fused(self, text, prefix):
+        p = self.llm.generate(_input_prompt(FUSED_PARSER_SYSTEM_PROMPT, text), FusedParser).node
+        self.log( prefix + f"Fused parser. Kind: {p.kind}")
+        annotate(decision=p.kind)
+        if p.kind in FUSED_RELATION_KINDS:
+            node, message = _relation_node(FUSED_RELATION_KINDS[p.kind], p)
+            self.log(prefix + message)
+            return node
+        elif p.kind == 'quantified':
+            if _quantified_is_atomic(text, p):
+                return self._parse_relation(text, prefix)
+            s = self.parse(p.sentence_without_quantifier, True, prefix)
+            return QuantifiedSentence(quantifier=p.quantifier, variable=Variable(name=p.variable if p.variable != "" else "x"), sentence=s)
+        elif p.kind == 'binary':
+            if _binary_is_atomic(text, p):
+                return self._parse_relation(text, prefix)
+            left = self.parse(p.left_operand, False, prefix)
+            right = self.parse(p.right_operand, True, prefix)
+            return BinaryOperator(operator=p.operator, left=left, right=right)
+        elif p.kind == 'unary':
+            if _unary_is_atomic(text, p):
+                return self._parse_relation(text, prefix)
+            s = self.parse(p.operand, True, prefix)
+            return UnaryOperator(operator=p.operator, sentence=s)
         else:
-            p = "│    "
+            raise ValueError("Invalid fused parser kind")
 
-        if last:
-            q = "└────"
+    def _parse(self, text, prefix):
+        if self.strategy == "fused":
+            return self._parse_fused(text, prefix)
+        prefetched = None
+        if self.speculator is not None:
+            choose_parser, prefetched = self.speculator.run(
+                self.llm, "parser", _depth(prefix), (_classify_prompt(text), ChooseParser), _parser_followups(text))
         else:
-            q = "├────"
-        self.log( prefix + q + f"Parsing '{text}'")
-        choose_parser =  self.llm.generate(
-                    CHOOSE_PARSER_SYSTEM_PROMPT + "Now, classify this\n\nSentence: '" + text + "'\nAnswer: ", 
-                    ChooseParser)
+            choose_parser =  self.llm.generate(_classify_prompt(text), ChooseParser)
         ans = choose_parser.answer
-        prefix += p
+        annotate(decision=ans)
         self.log( prefix + f"Answer: {ans}")
         if ans == 'A':
             # Relation
-            return self._parse_relation(text, prefix)
+            return self._parse_relation(text, prefix, prefetched)
         elif ans == 'B':
             # Quantified
-            return self._parse_quantified(text, prefix)
+            return self._parse_quantified(text, prefix, prefetched)
         elif ans == 'C':
             # Binary operator:
-            return self._parse_binary(text, prefix)
+            return self._parse_binary(text, prefix, prefetched)
         elif ans == 'D':
             # Unary operator
-            return self._parse_unary(text, prefix)
+            return self._parse_unary(text, prefix, prefetched)
+        else:
+            raise ValueError("Invalid parser option")
+
+
+class AsyncPipeline(Pipeline):
+    """Pipeline whose calls are awaitable; both operands of a binary node are parsed concurrently.
+
+    Usage: `tree = await AsyncPipeline(llm="gemini", model=...).rephrase_and_parse(text)`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._inflight = {}
+
+    async def _rephrase(self, text):
+        r = await self.llm.agenerate(_rephrase_prompt(text), Rephrased)
+        self.log(f"Rephrased '{text}' to '{r.rephrased}'")
+        return r.rephrased
+
+    @traced("rule")
+    async def rephrase_and_parse(self, text):
+        with sentence_scope(self.budget):
+            try:
+                text = await self._rephrase(text)
+            except BudgetExceeded as e:
+                return self._collapse(text, e.reason)
+            if self.strategy == "oneshot":
+                return await self.parse_oneshot(text, True, "")
+            return await self.parse(text, True, "")
+
+    @traced("parse.oneshot")
+    async def parse_oneshot(self, text, last, prefix):
+        p, q = _tree_prefixes(last)
+        self.log( prefix + q + f"One-shot parsing '{text}'")
+        prefix += p
+        annotate(depth=_depth(prefix))
+        if self.memo is not None:
+            tree = self.memo.get(text)
+            if tree is not None:
+                self.log( prefix + f"Reused parse: {tree}")
+                annotate(memo_hit=True)
+                return tree
+        try:
+            r = await self.llm.agenerate(_input_prompt(ONESHOT_SYSTEM_PROMPT, text), OneShotParser)
+        except BudgetExceeded as e:
+            return self._collapse(text, e.reason, prefix)
+        try:
+            plan = _oneshot_plan(r.nodes, 0)
+        except _OneShotInvalid:
+            plan = ('fallback', text)
+        self.log( prefix + f"One-shot parser. Nodes: {len(r.nodes)}")
+        tree = await self._build_oneshot(plan, True, prefix)
+        if self.memo is not None and not is_degraded(tree):
+            self.memo.put(text, tree)
+        return tree
+
+    async def _build_oneshot(self, plan, last, prefix):
+        kind = plan[0]
+        if kind == 'fallback':
+            self.log( prefix + "Invalid one-shot subtree, falling back")
+            return await self.parse(plan[1], last, prefix)
+        elif kind == 'relation':
+            return plan[1]
+        elif kind == 'quantified':
+            s = await self._build_oneshot(plan[3], True, prefix)
+            return QuantifiedSentence(quantifier=plan[1], variable=Variable(name=plan[2]), sentence=s)
+        elif kind == 'binary':
+            left, right = await asyncio.gather(
+                self._build_oneshot(plan[2], False, prefix),
+                self._build_oneshot(plan[3], True, prefix)
+            )
+            return BinaryOperator(operator=plan[1], left=left, right=right)
+        else:
+            s = await self._build_oneshot(plan[2], True, prefix)
+            return UnaryOperator(operator=plan[1], sentence=s)
+
+    @traced("parse.relation")
+    async def _parse_relation(self, text, prefix, choose_relation=None):
+        p = None
+        if choose_relation is None and self.speculator is not None:
+            choose_relation, p = await self.speculator.arun(
+                self.llm, "relation", _depth(prefix),
+                (_input_prompt(CHOOSE_RELATION_SYSTEM_PROMPT, text), ChooseRelation), _relation_followups(text))
+        elif choose_relation is None:
+            choose_relation = await self.llm.agenerate(_input_prompt(CHOOSE_RELATION_SYSTEM_PROMPT, text), ChooseRelation)
+        answer = choose_relation.answer
+        annotate(decision=answer)
+        if answer not in RELATION_PARSERS:
+            raise ValueError("Invalid relation option")
+        if p is None:
+            system_prompt, fmt = RELATION_PARSERS[answer]
+            p = await self.llm.agenerate(_input_prompt(system_prompt, text), fmt)
+        node, message = _relation_node(answer, p)
+        self.log(prefix + message)
+        return node
+
+    @traced("parse.quantified")
+    async def _parse_quantified(self, text, prefix, p=None):
+        if p is None:
+            p = await self.llm.agenerate(_input_prompt(QUANTIFIED_SYSTEM_PROMPT, text), QuantifiedParser)
+        self.log(prefix + f"Quantified parser. Quantifier: {p.quantifier}, Variable: {p.variable}")
+        if _quantified_is_atomic(text, p):
+            return await self._parse_relation(text, prefix)
+        else:
+            s = await self.parse(p.sentence_without_quantifier, True, prefix)
+            return QuantifiedSentence(quantifier=p.quantifier, variable=Variable(name=p.variable if p.variable != "" else "x"), sentence=s)
+
+    @traced("parse.binary")
+    async def _parse_binary(self, text, prefix, p=None):
+        if p is None:
+            p = await self.llm.agenerate(_input_prompt(BINARY_LOGICAL_SYSTEM_PROMPT, text), BinaryLogicalParser)
+        self.log(prefix + f"Binary operator parser. Operator: {p.operator}")
+        if _binary_is_atomic(text, p):
+            return await self._parse_relation(text, prefix)
+        else:
+            left, right = await asyncio.gather(
+                self.parse(p.left_operand, False, prefix),
+                self.parse(p.right_operand, True, prefix)
+            )
+            return BinaryOperator(operator=p.operator, left=left, right=right)
+
+    @traced("parse.unary")
+    async def _parse_unary(self, text, prefix, p=None):
+        if p is None:
+            p = await self.llm.agenerate(_input_prompt(UNARY_LOGICAL_SYSTEM_PROMPT, text), UnaryLogicalParser)
+        self.log(prefix + f"Unary operator parser. Operator: {p.operator}")
+        if _unary_is_atomic(text, p):
+            return await self._parse_relation(text, prefix)
+        else:
+            s = await self.parse(p.operand, True, prefix)
+            return UnaryOperator(operator=p.operator, sentence=s)
+
+    @traced("parse")
+    async def parse(self, text, last, prefix):
+        p, q = _tree_prefixes(last)
+        self.log( prefix + q + f"Parsing '{text}'")
+        prefix += p
+        annotate(depth=_depth(prefix))
+        if self.memo is None:
+            return await self._parse_within_budget(text, prefix)
+
+        tree = self.memo.get(text)
+        if tree is not None:
+            self.log( prefix + f"Reused parse: {tree}")
+            annotate(memo_hit=True)
+            return tree
+
+        # Concurrent siblings may hit the same clause; share the in-flight parse
+        key = normalize_sentence(text)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._parse_within_budget(text, prefix))
+            self._inflight[key] = task
+            try:
+                tree = await task
+            finally:
+                self._inflight.pop(key, None)
+            if not is_degraded(tree):
+                self.memo.put(text, tree)
+            return tree
+        return await asyncio.shield(task)
+
+    async def _parse_within_budget(self, text, prefix):
+        reason = exhausted(_depth(prefix))
+        if reason is None:
+            try:
+                return await self._parse(text, prefix)
+            except BudgetExceeded as e:
+                reason = e.reason
+        return self._collapse(text, reason, prefix)
+
+    @traced("parse.fused")
+    async def _parse_fused(self, text, prefix):
+        p = (await self.llm.agenerate(_input_prompt(FUSED_PARSER_SYSTEM_PROMPT, text), FusedParser)).node
+        self.log( prefix + f"Fused parser. Kind: {p.kind}")
+        annotate(decision=p.kind)
+        if p.kind in FUSED_RELATION_KINDS:
+            node, message = _relation_node(FUSED_RELATION_KINDS[p.kind], p)
+            self.log(prefix + message)
+            return node
+        elif p.kind == 'quantified':
+            if _quantified_is_atomic(text, p):
+                return await self._parse_relation(text, prefix)
+            s = await self.parse(p.sentence_without_quantifier, True, prefix)
+            return QuantifiedSentence(quantifier=p.quantifier, variable=Variable(name=p.variable if p.variable != "" else "x"), sentence=s)
+        elif p.kind == 'binary':
+            if _binary_is_atomic(text, p):
+                return await self._parse_relation(text, prefix)
+            left, right = await asyncio.gather(
+                self.parse(p.left_operand, False, prefix),
+                self.parse(p.right_operand, True, prefix)
+            )
+            return BinaryOperator(operator=p.operator, left=left, right=right)
+        elif p.kind == 'unary':
+            if _unary_is_atomic(text, p):
+                return await self._parse_relation(text, prefix)
+            s = await self.parse(p.operand, True, prefix)
+            return UnaryOperator(operator=p.operator, sentence=s)
+        else:
+            raise ValueError("Invalid fused parser kind")
+
+    async def _parse(self, text, prefix):
+        if self.strategy == "fused":
+            return await self._parse_fused(text, prefix)
+        prefetched = None
+        if self.speculator is not None:
+            choose_parser, prefetched = await self.speculator.arun(
+                self.llm, "parser", _depth(prefix), (_classify_prompt(text), ChooseParser), _parser_followups(text))
+        else:
+            choose_parser = await self.llm.agenerate(_classify_prompt(text), ChooseParser)
+        ans = choose_parser.answer
+        annotate(decision=ans)
+        self.log( prefix + f"Answer: {ans}")
+        if ans == 'A':
+            return await self._parse_relation(text, prefix, prefetched)
+        elif ans == 'B':
+            return await self._parse_quantified(text, prefix, prefetched)
+        elif ans == 'C':
+            return await self._parse_binary(text, prefix, prefetched)
+        elif ans == 'D':
+            return await self._parse_unary(text, prefix, prefetched)
         else:
             raise ValueError("Invalid parser option")
-        
\ No newline at end of file
@@ -0,0 +1,208 @@
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import datetime
+import argparse
+import threading
+from pathlib import Path
+
+from api_logger import read_log, prompt_text
+
+LATENCY_MODELS = ("none", "fixed", "normal", "lognormal", "recorded")
+
+
+def _schema_name(fmt):
+    return getattr(fmt, "__name__", str(fmt))
+
+
+def recording_key(text, schema_name):
+    """Replay key of a call: full prompt text plus the response type name.
+
+    The backend and model are left out on purpose so a recording made with one
+    provider can be replayed under any Pipeline configuration.
+    """
+    h = hashlib.sha256()
+    h.update(str(text).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(schema_name.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ReplayMiss(KeyError):
+    """The recording has no response for a prompt"""
+
+
+class LLMRecorder:
+    """Wrapper that appends every successful call to a JSONL recording"""
+
+    def __init__(self, llm_wrapper, path=None, wrapper_name="LLMWrapper", model=""):
+        if path is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            path = Path(".recordings") / f"llm_{timestamp}.jsonl"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.wrapper = llm_wrapper
+        self.wrapper_name = wrapper_name
+        self.model = model
+        self._lock = threading.Lock()
+
+    def _record(self, text, fmt, response, latency):
+        schema = _schema_name(fmt)
+        record = {
+            "key": recording_key(text, schema),
+            "template": getattr(text, "template_name", ""),
+            "schema": schema,
+            "backend": self.wrapper_name,
+            "model": self.model,
+            "prompt": str(text),
+            "response": response.model_dump(mode="json"),
+            "latency": round(latency, 6)
+        }
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def generate(self, text, fmt):
+        start_time = time.time()
+        response = self.wrapper.generate(text, fmt)
+        self._record(text, fmt, response, time.time() - start_time)
+        return response
+
+    async def agenerate(self, text, fmt):
+        start_time = time.time()
+        response = await self.wrapper.agenerate(text, fmt)
+        self._record(text, fmt, response, time.time() - start_time)
+        return response
+
+
+def load_recordings(paths):
+    """Records from JSONL recordings (files or directories), in recording order"""
+    records = []
+    for path in [paths] if isinstance(paths, (str, Path)) else paths:
+        path = Path(path)
+        files = sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        records.append(json.loads(line))
+    return records
+
+
+class ReplayWrapper:
+    """Serves recorded responses by prompt/schema key without touching the network.
+
+    Repeated keys are answered with their recorded responses in order, cycling
+    once exhausted. `latency` simulates the provider delay:
+      none       no delay
+      fixed      always `mean` seconds
+      normal     gaussian(mean, std), clipped at 0
+      lognormal  log-normal with the given mean and std (long right tail)
+      recorded   the latency stored with each record
+    `scale` multiplies every delay, e.g. 0.1 to replay ten times faster.
+    """
+
+    def __init__(self, path, latency="recorded", mean=0.5, std=0.2, scale=1.0, seed=0):
+        if latency not in LATENCY_MODELS:
+            raise ValueError(f"Latency model is not valid: {latency}")
+        self.path = path
+        self.latency = latency
+        self.mean = mean
+        self.std = std
+        self.scale = scale
+        self.responses = {}
+        for record in load_recordings(path):
+            self.responses.setdefault(record["key"], []).append(record)
+        self.calls = 0
+        self.misses = 0
+        self._cursor = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next(self, text, fmt):
+        key = recording_key(text, _schema_name(fmt))
+        with self._lock:
+            self.calls += 1
+            records = self.responses.get(key)
+            if not records:
+                self.misses += 1
+                raise ReplayMiss(f"No recorded {_schema_name(fmt)} response for prompt: {str(text)[-200:]!r}")
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            record = records[i % len(records)]
+            delay = self._delay(record)
+        return fmt.model_validate(record["response"]), delay
+
+    def _delay(self, record):
+        if self.latency == "none":
+            delay = 0.0
+        elif self.latency == "fixed":
+            delay = self.mean
+        elif self.latency == "normal":
+            delay = max(0.0, self._rng.gauss(self.mean, self.std))
+        elif self.latency == "lognormal":
+            # Parameters of the underlying normal that give the requested mean/std
+            sigma2 = math.log(1 + (self.std / self.mean) ** 2)
+            delay = self._rng.lognormvariate(math.log(self.mean) - sigma2 / 2, math.sqrt(sigma2))
+        else:
+            delay = record.get("latency", 0.0)
+        return delay * self.scale
+
+    def generate(self, text, fmt):
+        response, delay = self._next(text, fmt)
+        if delay:
+            time.sleep(delay)
+        return response
+
+    async def agenerate(self, text, fmt):
+        response, delay = self._next(text, fmt)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
+
+    def stats(self):
+        return {
+            "keys": len(self.responses),
+            "records": sum(len(r) for r in self.responses.values()),
+            "calls": self.calls,
+            "misses": self.misses
+        }
+
+
+def records_from_api_logs(paths):
+    """Convert APILogger JSONL files into replay records"""
+    records = []
+    for call, outcome in read_log(paths):
+        if outcome is None or outcome.get("event") != "response":
+            continue
+        text = prompt_text(call)
+        records.append({
+            "key": recording_key(text, call["schema"]),
+            "template": call.get("template", ""),
+            "schema": call["schema"],
+            "backend": call.get("wrapper", ""),
+            "model": "",
+            "prompt": text,
+            "response": outcome["response"],
+            "latency": outcome.get("elapsed") or 0.0
+        })
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a replay recording from APILogger files")
+    parser.add_argument("logs", nargs="*", default=[".log"], help="APILogger files or directories")
+    parser.add_argument("-o", "--output", default=".recordings/from_logs.jsonl")
+    args = parser.parse_args()
+
+    records = records_from_api_logs(args.logs)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"💾 Saved {len(records)} records to: {args.output}")
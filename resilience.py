@@ -0,0 +1,241 @@
+import re
+import time
+import random
+import asyncio
+import threading
+import email.utils
+
+# HTTP statuses worth retrying; 429/503 also mean the provider is throttling us
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+RETRYABLE_ERRORS = {
+    "APITimeoutError", "APIConnectionError", "TimeoutException", "ConnectTimeout",
+    "ReadTimeout", "WriteTimeout", "PoolTimeout", "ConnectError", "ReadError", "RemoteProtocolError"
+}
+
+
+def _status_code(error):
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+def is_throttled(error):
+    return _status_code(error) in THROTTLE_STATUS
+
+
+def retry_after(error):
+    """Delay in seconds requested by the provider, or None"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(value)
+                return max(0.0, parsed.timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    # Gemini puts RetryInfo in the error details, e.g. "retryDelay": "30s"
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "") or error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """Requests-per-second limiter with a burst capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if available, otherwise return the seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self):
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight calls: +1 per window of successes, multiplicative cut on throttling"""
+
+    def __init__(self, initial=8, minimum=1, maximum=64, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def aacquire(self):
+        while not self._try_acquire():
+            await asyncio.sleep(0.01)
+
+    def release(self, throttled=False, success=True):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            elif success:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ResiliencePolicy:
+    """Retry, rate-limit and concurrency settings for one provider/model"""
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0, requests_per_second=None, burst=None,
+                 initial_concurrency=8, max_concurrency=64):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+
+    def backoff(self, attempt, error):
+        """Exponential backoff with full jitter, never shorter than the provider's retry-after"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after(error)
+        if hint is not None:
+            delay = max(delay, min(hint, self.max_delay))
+        return delay
+
+
+# Limiters are shared by every wrapper talking to the same provider and model
+# with the same limits; a policy with other limits gets its own pair
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiters(backend, model, policy):
+    with _limiters_lock:
+        key = (backend, model, policy.requests_per_second, policy.burst,
+               policy.initial_concurrency, policy.max_concurrency)
+        if key not in _limiters:
+            bucket = TokenBucket(policy.requests_per_second, policy.burst) if policy.requests_per_second else None
+            concurrency = AdaptiveConcurrency(policy.initial_concurrency, maximum=policy.max_concurrency)
+            _limiters[key] = (bucket, concurrency)
+        return _limiters[key]
+
+
+class ResilientLLM:
+    """Wrapper adding rate limiting, retries with backoff and adaptive concurrency"""
+
+    def __init__(self, llm_wrapper, backend="LLMWrapper", model="", policy=None, metrics=None):
+        self.wrapper = llm_wrapper
+        self.backend = backend
+        self.model = model
+        self.policy = policy or ResiliencePolicy()
+        self.metrics = metrics
+        self.bucket, self.concurrency = get_limiters(backend, model, self.policy)
+
+    def _on_retry(self, text):
+        if self.metrics is not None:
+            self.metrics.record_retry(getattr(text, "template_name", ""), self.backend, self.model)
+
+    def generate(self, text, fmt):
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self.concurrency.acquire()
+            released = False
+            try:
+                response = self.wrapper.generate(text, fmt)
+            except Exception as e:
+                released = True
+                self.concurrency.release(throttled=is_throttled(e), success=False)
+                if attempt >= self.policy.max_retries or not is_retryable(e):
+                    raise
+                self._on_retry(text)
+                time.sleep(self.policy.backoff(attempt, e))
+                attempt += 1
+                continue
+            else:
+                released = True
+                self.concurrency.release()
+                return response
+            finally:
+                # Cancelled (e.g. a losing speculative call): free the slot, keep the limit
+                if not released:
+                    self.concurrency.release(success=False)
+
+    async def agenerate(self, text, fmt):
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                await self.bucket.aacquire()
+            await self.concurrency.aacquire()
+            released = False
+            try:
+                response = await self.wrapper.agenerate(text, fmt)
+            except Exception as e:
+                released = True
+                self.concurrency.release(throttled=is_throttled(e), success=False)
+                if attempt >= self.policy.max_retries or not is_retryable(e):
+                    raise
+                self._on_retry(text)
+                await asyncio.sleep(self.policy.backoff(attempt, e))
+                attempt += 1
+                continue
+            else:
+                released = True
+                self.concurrency.release()
+                return response
+            finally:
+                # Cancelled (e.g. a losing speculative call): free the slot, keep the limit
+                if not released:
+                    self.concurrency.release(success=False)
@@ -0,0 +1,164 @@
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+
+def normalize_contract(text):
+    """Whitespace-insensitive form of a contract or clause window, used for cache keys"""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class SchemaCache:
+    """Persistent store of extracted contracts and of the per-window partial contracts.
+
+    Contracts are keyed on the normalized contract text, windows on the
+    normalized window text; both keys include the namespace and the extraction
+    prompt so a prompt change invalidates the stored results. A contract entry
+    also keeps the clause segments and window spans it was extracted from, and
+    the latest entry per `document` is remembered so an edited version can be
+    diffed against it.
+    """
+
+    def __init__(self, path=None, namespace=""):
+        if path is None:
+            cache_dir = Path(".cache")
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            path = cache_dir / "schema_cache.sqlite"
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.window_hits = 0
+        self.window_misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS contracts (
+                    key TEXT PRIMARY KEY,
+                    contract TEXT NOT NULL,
+                    segments TEXT,
+                    spans TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS windows (
+                    key TEXT PRIMARY KEY,
+                    partial TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    document TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+
+    def make_key(self, text, prompt=""):
+        h = hashlib.sha256()
+        for part in (self.namespace, prompt, normalize_contract(text)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def get(self, text, prompt=""):
+        """The stored contract dict for this contract text, or None"""
+        key = self.make_key(text, prompt)
+        with self._lock:
+            row = self._conn.execute("SELECT contract FROM contracts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, text, contract, prompt="", segments=None, spans=None, document=None):
+        key = self.make_key(text, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contracts (key, contract, segments, spans, created_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    json.dumps(contract, ensure_ascii=False),
+                    json.dumps(segments, ensure_ascii=False) if segments is not None else None,
+                    json.dumps(spans) if spans is not None else None,
+                    now
+                )
+            )
+            if document is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (document, key, updated_at) VALUES (?, ?, ?)",
+                    (str(document), key, now)
+                )
+            self._conn.commit()
+
+    def latest(self, document):
+        """{"contract", "segments", "spans"} of the last windowed extraction of a document, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT c.contract, c.segments, c.spans FROM documents d
+                   JOIN contracts c ON c.key = d.key WHERE d.document = ?""",
+                (str(document),)
+            ).fetchone()
+        if row is None or row[1] is None or row[2] is None:
+            return None
+        return {
+            "contract": json.loads(row[0]),
+            "segments": json.loads(row[1]),
+            "spans": [tuple(span) for span in json.loads(row[2])]
+        }
+
+    def get_window(self, text, prompt=""):
+        """The stored partial contract of a clause window, or None"""
+        key = self.make_key(text, prompt)
+        with self._lock:
+            row = self._conn.execute("SELECT partial FROM windows WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.window_misses += 1
+                return None
+            self.window_hits += 1
+        return json.loads(row[0])
+
+    def put_window(self, text, partial, prompt=""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO windows (key, partial, created_at) VALUES (?, ?, ?)",
+                (self.make_key(text, prompt), json.dumps(partial, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            for table in ("contracts", "windows", "documents"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            contracts = self._conn.execute("SELECT COUNT(*) FROM contracts").fetchone()[0]
+            windows = self._conn.execute("SELECT COUNT(*) FROM windows").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "window_hits": self.window_hits,
+            "window_misses": self.window_misses,
+            "contracts": contracts,
+            "windows": windows
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,59 @@
+import sys
+import argparse
+from pydantic import BaseModel
+
+import structured_output
+from deontic_gen_types import ContractOutput
+
+# Response models sent as provider schemas: every parser type plus the contract schema
+MODELS = {
+    name: obj for name, obj in vars(structured_output).items()
+    if isinstance(obj, type) and issubclass(obj, BaseModel) and obj is not BaseModel
+    and obj.__module__ == structured_output.__name__
+}
+MODELS["ContractOutput"] = ContractOutput
+
+
+def gemini_problem(model):
+    """Error converting the model to a Gemini request schema, or None"""
+    from google.genai import _transformers
+    from google.genai._api_client import BaseApiClient
+    try:
+        # Same conversion generate_content applies to response_schema, no network involved
+        _transformers.t_schema(BaseApiClient(api_key="schema-check"), model)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def openai_problem(model):
+    """Error converting the model to an OpenAI strict json_schema, or None"""
+    from openai.lib._pydantic import to_strict_json_schema
+    try:
+        to_strict_json_schema(model)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+CHECKS = {"gemini": gemini_problem, "openai": openai_problem}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that every response model converts to each provider's schema format")
+    parser.add_argument("models", nargs="*", default=sorted(MODELS), help="Model names (default: all)")
+    parser.add_argument("-p", "--providers", nargs="+", default=list(CHECKS), choices=list(CHECKS))
+    args = parser.parse_args()
+
+    failed = False
+    for provider in args.providers:
+        try:
+            CHECKS[provider](MODELS["Rephrased"])
+        except ImportError:
+            print(f"⚠️  {provider}: SDK not installed, skipped")
+            continue
+        for name in args.models:
+            problem = CHECKS[provider](MODELS[name])
+            print(f"{'❌' if problem else '✅'} {provider:<7}{name:<22}{problem or ''}")
+            failed = failed or problem is not None
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,165 @@
+import json
+import asyncio
+import threading
+import contextvars
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Depths past this share one set of priors
+MAX_DEPTH = 8
+
+
+class SpeculationPriors:
+    """Per (stage, depth) counts of the classifier answers seen so far"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        self.counts = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.counts = json.load(f)
+
+    def _key(self, stage, depth):
+        return f"{stage}:{min(depth, MAX_DEPTH)}"
+
+    def update(self, stage, depth, answer):
+        with self._lock:
+            counts = self.counts.setdefault(self._key(stage, depth), {})
+            counts[answer] = counts.get(answer, 0) + 1
+
+    def ranked(self, stage, depth):
+        """[(answer, probability)] most likely first, empty without history"""
+        with self._lock:
+            counts = dict(self.counts.get(self._key(stage, depth), {}))
+        total = sum(counts.values())
+        if total == 0:
+            return []
+        return sorted(((a, c / total) for a, c in counts.items()), key=lambda x: -x[1])
+
+    def observations(self, stage, depth):
+        with self._lock:
+            return sum(self.counts.get(self._key(stage, depth), {}).values())
+
+    def save(self, path=None):
+        path = Path(path) if path is not None else self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.counts, f, indent=2)
+
+
+class Speculator:
+    """Fires a classifier prompt together with its most likely follow-up prompt(s).
+
+    `followups` maps each possible classifier answer to the (prompt, fmt) of the
+    next stage. Follow-ups whose prior probability reaches `min_probability`
+    (at most `top_k` of them) are sent concurrently with the classifier; the
+    one matching the real answer is kept and the others are discarded.
+    """
+
+    def __init__(self, priors=None, top_k=1, min_probability=0.4, warmup=5, max_workers=16):
+        self.priors = priors if priors is not None else SpeculationPriors()
+        self.top_k = top_k
+        self.min_probability = min_probability
+        self.warmup = warmup
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self.wasted_calls = 0
+        self.skipped = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _choose(self, stage, depth, followups):
+        if self.priors.observations(stage, depth) < self.warmup:
+            return []
+        ranked = [a for a, p in self.priors.ranked(stage, depth) if p >= self.min_probability and a in followups]
+        return ranked[:self.top_k]
+
+    def _record(self, stage, depth, answer, speculated):
+        self.priors.update(stage, depth, answer)
+        with self._lock:
+            if not speculated:
+                self.skipped += 1
+            elif answer in speculated:
+                self.hits += 1
+                self.wasted_calls += len(speculated) - 1
+            else:
+                self.misses += 1
+                self.wasted_calls += len(speculated)
+
+    def run(self, llm, stage, depth, classify, followups):
+        """Returns (classifier response, follow-up response for its answer or None)"""
+        speculated = self._choose(stage, depth, followups)
+        if not speculated:
+            response = llm.generate(*classify)
+            self._record(stage, depth, response.answer, speculated)
+            return response, None
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="speculate")
+        # Run in a copy of the caller's context so usage metrics and budgets see the call
+        futures = {a: self._executor.submit(contextvars.copy_context().run, llm.generate, *followups[a]) for a in speculated}
+        try:
+            response = llm.generate(*classify)
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+        self._record(stage, depth, response.answer, speculated)
+
+        prefetched = None
+        for answer, future in futures.items():
+            if answer == response.answer:
+                try:
+                    prefetched = future.result()
+                except Exception:
+                    # The speculative copy failed; the caller will simply re-issue it
+                    prefetched = None
+            else:
+                future.cancel()
+        return response, prefetched
+
+    async def arun(self, llm, stage, depth, classify, followups):
+        speculated = self._choose(stage, depth, followups)
+        if not speculated:
+            response = await llm.agenerate(*classify)
+            self._record(stage, depth, response.answer, speculated)
+            return response, None
+
+        tasks = {a: asyncio.ensure_future(llm.agenerate(*followups[a])) for a in speculated}
+        try:
+            response = await llm.agenerate(*classify)
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        self._record(stage, depth, response.answer, speculated)
+
+        prefetched = None
+        for answer, task in tasks.items():
+            if answer == response.answer:
+                try:
+                    prefetched = await task
+                except Exception:
+                    prefetched = None
+            else:
+                task.cancel()
+        return response, prefetched
+
+    def stats(self):
+        speculated = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / speculated if speculated else 0.0,
+            "wasted_calls": self.wasted_calls,
+            "not_speculated": self.skipped
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Literal, Union
 
 class Rephrased(BaseModel):
     rephrased : str
@@ -380,4 +380,185 @@ Output: {"subject": "Mary", "verb": "write", "indirect_obj": "her friend", "dire
 Input: "Mary teaches John to swim"
 Output: {"subject": "Mary", "verb": "teach", "indirect_obj": "John", "direct_obj": "to swim"}
 
-"""
\ No newline at end of file
+"""
+
+class FusedQuantified(BaseModel):
+    kind : Literal["quantified"]
+    quantifier : Literal['ForAll', 'ThereExists']
+    variable : str
+    sentence_without_quantifier : str
+
+class FusedBinary(BaseModel):
+    kind : Literal["binary"]
+    operator : Literal["And", "Or", "If", "OnlyIf", "IfAndOnlyIf"]
+    left_operand : str
+    right_operand : str
+
+class FusedUnary(BaseModel):
+    kind : Literal["unary"]
+    operator : Literal["Not"]
+    operand : str
+
+class FusedAdjective(BaseModel):
+    kind : Literal["adjective"]
+    adjective : str
+    obj : str
+
+class FusedIntransitive(BaseModel):
+    kind : Literal["intransitive"]
+    verb : str
+    subject : str
+
+class FusedTransitive(BaseModel):
+    kind : Literal["transitive"]
+    subject : str
+    verb : str
+    obj : str
+
+class FusedDitransitive(BaseModel):
+    kind : Literal["ditransitive"]
+    subject : str
+    verb : str
+    indirect_obj : str
+    direct_obj : str
+
+class FusedParser(BaseModel):
+    # A plain Union (anyOf): Gemini rejects the oneOf/discriminator of a
+    # discriminated union; the distinct `kind` literals still select the member
+    node : Union[FusedQuantified, FusedBinary, FusedUnary, FusedAdjective, FusedIntransitive, FusedTransitive, FusedDitransitive]
+
+FUSED_PARSER_SYSTEM_PROMPT = """You classify a sentence by its OUTERMOST logical structure and, in the same answer, extract its parts.
+
+Choose exactly one kind:
+- quantified   = a general rule that covers many entities (all, every, some, there is, no one). Only the outermost quantifier counts; if the sentence only mentions specific proper names or instances of variables (x,y,z), it is NOT quantified.
+    quantifier : ForAll or ThereExists
+    variable   : a letter like x, y or z replacing the quantified noun phrase
+    sentence_without_quantifier : the sentence rewritten without the outermost quantifier, keeping the variable in place
+- binary       = two clauses joined by the top-level connective And, Or, If ("if ... then", antecedent = left), OnlyIf ("P only if Q") or IfAndOnlyIf.
+    left_operand, right_operand : each a clean standalone clause with subject and verb; resolve co-references (she, he, it) and preserve the exact wording and capitalization of names
+- unary        = a literal negation ('not', 'no', 'dont', 'doesnt') of another sentence.
+    operator : always "Not"
+    operand  : the sentence without the outermost negation
+- adjective    = an atomic sentence giving a property of one entity.
+    adjective : the property in base form; obj : the entity described, copied verbatim
+- intransitive = an atomic sentence with a verb that takes no object.
+    verb : base form; subject : copied verbatim
+- transitive   = an atomic sentence with a verb that takes exactly one object.
+    subject, obj : copied verbatim (use the infinitive form for verbal objects); verb : base form
+- ditransitive = an atomic sentence with a verb that takes two objects.
+    subject, indirect_obj (recipient), direct_obj (thing given/sent/shown) : copied verbatim; verb : base form
+
+Atomic sentences have no quantifier, no logical connective and no negation.
+
+Examples:
+
+Input: "Every student studies and sleeps."
+Output: {"node": {"kind": "quantified", "quantifier": "ForAll", "variable": "x", "sentence_without_quantifier": "x studies and x sleeps"}}
+
+Input: "If John sings and Mary dances, then Alice claps."
+Output: {"node": {"kind": "binary", "operator": "If", "left_operand": "John sings and Mary dances", "right_operand": "Alice claps"}}
+
+Input: "x does not sing."
+Output: {"node": {"kind": "unary", "operator": "Not", "operand": "x sings"}}
+
+Input: "Bob is very tired."
+Output: {"node": {"kind": "adjective", "adjective": "very tired", "obj": "Bob"}}
+
+Input: "The student sleeps."
+Output: {"node": {"kind": "intransitive", "verb": "sleep", "subject": "The student"}}
+
+Input: "Doe likes to read a book"
+Output: {"node": {"kind": "transitive", "subject": "Doe", "verb": "like", "obj": "to read a book"}}
+
+Input: "John gave a book to Mary."
+Output: {"node": {"kind": "ditransitive", "subject": "John", "verb": "give", "indirect_obj": "Mary", "direct_obj": "a book"}}
+
+"""
+
+
+class FormulaNode(BaseModel):
+    kind : Literal["quantified", "binary", "unary", "adjective", "intransitive", "transitive", "ditransitive"]
+    text : str = Field(description="The natural-language clause covered by this node, as a standalone sentence.")
+    quantifier : Literal["ForAll", "ThereExists", ""] = Field(default="", description="Only for quantified nodes.")
+    variable : str = Field(default="", description="Only for quantified nodes: the bound variable (x, y, z).")
+    operator : Literal["And", "Or", "If", "OnlyIf", "IfAndOnlyIf", "Not", ""] = Field(default="", description="Only for binary and unary nodes.")
+    predicate : str = Field(default="", description="Only for atomic nodes: the adjective or the verb in base form.")
+    arguments : list[str] = Field(default_factory=list, description="Only for atomic nodes: [obj] for adjective, [subject] for intransitive, [subject, obj] for transitive, [subject, indirect_obj, direct_obj] for ditransitive.")
+    children : list[int] = Field(default_factory=list, description="Indexes of the child nodes in the node list: 1 for quantified and unary, 2 (left, right) for binary, none for atomic nodes.")
+
+class OneShotParser(BaseModel):
+    nodes : list[FormulaNode] = Field(description="All nodes of the formula tree. nodes[0] is the root.")
+
+ONESHOT_SYSTEM_PROMPT = """You translate a sentence into a complete first-order logic formula tree in a single answer.
+
+The tree is a flat list of nodes; nodes[0] is the root and every non-atomic node lists the indexes of its children.
+Always split on the OUTERMOST structure first, then recurse into each part.
+
+Node kinds:
+- quantified   : a general rule over many entities (all, every, some, there is, no one). Set quantifier (ForAll or ThereExists), variable (x, y or z) and exactly one child: the sentence without the quantifier, using the variable.
+- binary       : two clauses joined by And, Or, If ("if ... then", antecedent = left), OnlyIf ("P only if Q") or IfAndOnlyIf. Set operator and exactly two children (left, right).
+- unary        : a literal negation ('not', 'no', 'dont', 'doesnt'). Set operator "Not" and exactly one child: the sentence without the outermost negation.
+- adjective    : atomic property. predicate = the adjective in base form, arguments = [obj].
+- intransitive : atomic verb with no object. predicate = verb in base form, arguments = [subject].
+- transitive   : atomic verb with one object. predicate = verb in base form, arguments = [subject, obj].
+- ditransitive : atomic verb with two objects. predicate = verb in base form, arguments = [subject, indirect_obj, direct_obj].
+
+Rules:
+- Every node's text is the clause it covers, rewritten as a clean standalone sentence with co-references resolved.
+- Copy entity names verbatim (keep capitalization). Use a variable as an argument only inside a quantifier that binds it.
+- Atomic nodes have no quantifier, no connective and no negation.
+
+Example:
+
+Input: "If someone studies hard, they pass the exam."
+Output: {"nodes": [
+  {"kind": "quantified", "text": "If someone studies hard, they pass the exam.", "quantifier": "ForAll", "variable": "x", "children": [1]},
+  {"kind": "binary", "text": "If x studies hard, x passes the exam.", "operator": "If", "children": [2, 3]},
+  {"kind": "intransitive", "text": "x studies hard", "predicate": "study hard", "arguments": ["x"]},
+  {"kind": "transitive", "text": "x passes the exam", "predicate": "pass", "arguments": ["x", "the exam"]}
+]}
+
+Example:
+
+Input: "Alice does not give Bob a book."
+Output: {"nodes": [
+  {"kind": "unary", "text": "Alice does not give Bob a book.", "operator": "Not", "children": [1]},
+  {"kind": "ditransitive", "text": "Alice gives Bob a book", "predicate": "give", "arguments": ["Alice", "Bob", "a book"]}
+]}
+
+"""
+
+
+# Static prompt templates by name. They are sent as a stable system/prefix
+# block so provider-side prefix and context caches can reuse them.
+PROMPT_TEMPLATES = {
+    'REPHRASE_SYSTEM_PROMPT': REPHRASE_SYSTEM_PROMPT,
+    'CHOOSE_PARSER_SYSTEM_PROMPT': CHOOSE_PARSER_SYSTEM_PROMPT,
+    'QUANTIFIED_SYSTEM_PROMPT': QUANTIFIED_SYSTEM_PROMPT,
+    'BINARY_LOGICAL_SYSTEM_PROMPT': BINARY_LOGICAL_SYSTEM_PROMPT,
+    'UNARY_LOGICAL_SYSTEM_PROMPT': UNARY_LOGICAL_SYSTEM_PROMPT,
+    'CHOOSE_RELATION_SYSTEM_PROMPT': CHOOSE_RELATION_SYSTEM_PROMPT,
+    'ADJECTIVE_SYSTEM_PROMPT': ADJECTIVE_SYSTEM_PROMPT,
+    'INTRANSITIVE_SYSTEM_PROMPT': INTRANSITIVE_SYSTEM_PROMPT,
+    'TRANSITIVE_SYSTEM_PROMPT': TRANSITIVE_SYSTEM_PROMPT,
+    'DITRANSITIVE_SYSTEM_PROMPT': DITRANSITIVE_SYSTEM_PROMPT,
+    'FUSED_PARSER_SYSTEM_PROMPT': FUSED_PARSER_SYSTEM_PROMPT,
+    'ONESHOT_SYSTEM_PROMPT': ONESHOT_SYSTEM_PROMPT
+}
+
+TEMPLATE_NAMES = {template: name for name, template in PROMPT_TEMPLATES.items()}
+
+class Prompt(str):
+    """Full prompt text that also remembers its static template and variable suffix.
+
+    It is a plain str (template + suffix) for callers that do not care, while
+    wrappers can send `template` as the system/prefix part and `suffix` as the
+    user message. `sentence` is the raw input text embedded in the suffix.
+    """
+    def __new__(cls, template, suffix, sentence=None):
+        prompt = super().__new__(cls, template + suffix)
+        prompt.template = template
+        prompt.suffix = suffix
+        prompt.sentence = sentence
+        prompt.template_name = TEMPLATE_NAMES.get(template, "")
+        return prompt
@@ -0,0 +1,247 @@
+import json
+import asyncio
+import functools
+import time
+import random
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+
+# Span currently open in this thread / task. asyncio tasks and the speculation
+# executor copy the context, so children started there keep their parent.
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+def annotate(**attributes):
+    """Add attributes to the innermost open span, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+class Tracer:
+    """Collects nested spans of parse steps and LLM calls"""
+
+    def __init__(self, service_name="nl2logic"):
+        self.service_name = service_name
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        span = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self.spans)
+
+    def to_chrome_trace(self):
+        """Trace Event Format, loadable in chrome://tracing or ui.perfetto.dev"""
+        events = []
+        for s in self._snapshot():
+            args = dict(s.attributes, span_id=s.span_id, parent_id=s.parent_id)
+            if s.error:
+                args["error"] = s.error
+            events.append({
+                "name": s.name,
+                "cat": s.name.split(".")[0],
+                "ph": "X",
+                "ts": s.start_ns / 1000,
+                "dur": (s.end_ns - s.start_ns) / 1000,
+                "pid": 1,
+                "tid": s.thread_id,
+                "args": args
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self):
+        """OTLP/JSON ExportTraceServiceRequest"""
+        spans = []
+        for s in self._snapshot():
+            span = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [_otlp_attribute(k, v) for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1}
+            }
+            if s.parent_id:
+                span["parentSpanId"] = s.parent_id
+            spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}]
+        }]}
+
+    def export(self, path, format=None):
+        """Write the spans as a Chrome trace ("chrome") or OTLP/JSON ("otlp");
+        the format defaults from the file name (*.otlp.json -> otlp)"""
+        path = Path(path)
+        if format is None:
+            format = "otlp" if "otlp" in path.name else "chrome"
+        if format not in ("chrome", "otlp"):
+            raise ValueError(f"Trace format is not valid: {format}")
+        data = self.to_otlp() if format == "otlp" else self.to_chrome_trace()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return path
+
+    def critical_paths(self):
+        """Per root span (one rule), the chain of spans that determined its end time"""
+        spans = self._snapshot()
+        children = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+        return [(root, _critical_path(root, children)) for root in sorted(children.get(None, []), key=lambda s: s.start_ns)]
+
+    def critical_path_summary(self):
+        """Human readable critical path per rule with the LLM calls on it"""
+        lines = []
+        for root, path in self.critical_paths():
+            llm = [s for s in path if s.name == "llm.generate"]
+            llm_time = sum(s.duration for s in llm)
+            text = str(root.attributes.get("text", ""))
+            lines.append(f"{root.name} {root.duration:.3f}s, {len(llm)} sequential LLM calls ({llm_time:.3f}s): {text[:80]}")
+            for s in path[1:]:
+                depth = s.attributes.get("depth")
+                label = s.attributes.get("template") or s.attributes.get("text", "")
+                decision = s.attributes.get("decision")
+                lines.append(
+                    f"  {s.name:<22}{s.duration:>8.3f}s"
+                    f"{'' if depth is None else f'  depth {depth}'}"
+                    f"{'' if decision is None else f'  -> {decision}'}  {str(label)[:60]}"
+                )
+        return "\n".join(lines)
+
+
+def _critical_path(span, children):
+    """The span, then walking back from its end: the last child to finish, recursively,
+    then whatever finished before that child started"""
+    path = []
+    cutoff = span.end_ns
+    remaining = sorted(children.get(span.span_id, []), key=lambda s: s.end_ns, reverse=True)
+    for child in remaining:
+        if child.end_ns <= cutoff:
+            path = _critical_path(child, children) + path
+            cutoff = child.start_ns
+    return [span] + path
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+class TracedLLM:
+    """Wrapper opening an llm.generate span per call, tagged with prompt type and answer"""
+
+    def __init__(self, llm_wrapper, tracer):
+        self.wrapper = llm_wrapper
+        self.tracer = tracer
+
+    def _attributes(self, text, fmt):
+        return {
+            "template": getattr(text, "template_name", ""),
+            "schema": getattr(fmt, "__name__", str(fmt)),
+            "text_length": len(getattr(text, "sentence", None) or text)
+        }
+
+    def generate(self, text, fmt):
+        with self.tracer.span("llm.generate", **self._attributes(text, fmt)) as span:
+            response = self.wrapper.generate(text, fmt)
+            if hasattr(response, "answer"):
+                span.set(decision=response.answer)
+            return response
+
+    async def agenerate(self, text, fmt):
+        with self.tracer.span("llm.generate", **self._attributes(text, fmt)) as span:
+            response = await self.wrapper.agenerate(text, fmt)
+            if hasattr(response, "answer"):
+                span.set(decision=response.answer)
+            return response
+
+
+def traced(name):
+    """Method decorator opening a span when the instance has a tracer.
+
+    The first argument is taken as the text being parsed.
+    """
+    def decorate(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, text, *args, **kwargs):
+                if self.tracer is None:
+                    return await method(self, text, *args, **kwargs)
+                with self.tracer.span(name, text=text, text_length=len(text)):
+                    return await method(self, text, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, text, *args, **kwargs):
+            if self.tracer is None:
+                return method(self, text, *args, **kwargs)
+            with self.tracer.span(name, text=text, text_length=len(text)):
+                return method(self, text, *args, **kwargs)
+        return wrapper
+    return decorate